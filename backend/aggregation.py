@@ -0,0 +1,171 @@
+import os
+import time
+
+import numpy as np
+from pulp import LpVariable, LpContinuous, LpInteger, lpSum
+
+from solver import make_solver, cancel_requested
+from warm_start import repair_start
+
+# === Commercial Aggregation ===
+# df_full holds every program once per commercial, and NTVR / NCost of those
+# copies only differ by the duration factor, so the copies are interchangeable
+# for the objective and branching on them is largely symmetric.
+# With "formulation": "aggregated" a program gets one integer total-spots
+# variable y_p = sum_c x_pc and the per-commercial variables x_pc become
+# continuous allocations; every row of the model (commercial and
+# channel × commercial cost shares included) stays written on x_pc.
+# That model is a relaxation of the per-commercial one, so its optimum bounds
+# the true optimum. Integer x_pc are then recovered by
+#   1. fixing every y_p at its value and solving for integer x_pc (small, easy),
+#   2. if that split is infeasible: the full model with y_p free again,
+# each started from the largest-remainder rounding of the allocation.
+# x_pc are the df_full rows, so results map back to the usual df_result layout.
+FORMULATIONS = ('per_commercial', 'aggregated')
+# Least time a recovery stage gets, even once stage 1 used up the time limit
+AGGREGATE_RECOVERY_MIN_SECONDS = float(os.environ.get("AGGREGATE_RECOVERY_MIN_SECONDS", 5))
+
+
+def request_formulation(data):
+    value = str(data.get('formulation') or '').strip().lower()
+    return value if value in FORMULATIONS else 'per_commercial'
+
+
+def program_groups(df):
+    """Row positions of each program's commercial copies (programs with >1 copy), or [] when not applicable."""
+    if 'Id' not in df.columns or 'Commercial' not in df.columns:
+        return []
+    groups = df.groupby(df['Id'].astype(str), sort=False).indices
+    return [idx for idx in groups.values() if len(idx) > 1]
+
+
+def aggregate_commercials(prob, x, groups):
+    """Add y_p = sum_c x_pc per group and relax the grouped x_pc; returns the y variables."""
+    y = []
+    for k, idx in enumerate(groups):
+        members = [x[i] for i in idx]
+        lo = sum(v.lowBound or 0 for v in members)
+        up = None if any(v.upBound is None for v in members) else sum(v.upBound for v in members)
+        total = LpVariable(f"y_{k}", lowBound=lo, upBound=up, cat=LpInteger)
+        if all(v.varValue is not None for v in members):
+            total.setInitialValue(sum(v.varValue for v in members))
+        for v in members:
+            v.cat = LpContinuous
+        prob += lpSum(members) - total == 0, f"aggregate_{k}"
+        y.append(total)
+    return y
+
+
+def round_allocation(x, y, groups):
+    """Integer x_pc per group summing to y_p: floors, then the largest remainders, within bounds."""
+    for total, idx in zip(y, groups):
+        members = [x[i] for i in idx]
+        values = np.array([v.varValue or 0.0 for v in members])
+        lo = np.array([v.lowBound if v.lowBound is not None else -np.inf for v in members])
+        up = np.array([v.upBound if v.upBound is not None else np.inf for v in members])
+        spots = np.clip(np.floor(values + 1e-6), lo, up)
+        left = int(round(total.varValue or 0)) - int(spots.sum())
+        for j in np.argsort(-(values - spots)):
+            if left <= 0:
+                break
+            room = min(left, up[j] - spots[j])
+            if room > 0:
+                spots[j] += room
+                left -= int(room)
+        for v, value in zip(members, spots.tolist()):
+            v.setInitialValue(value)
+
+
+def _stage(name, solver, seconds):
+    stats = solver.stats
+    return {
+        "stage": name,
+        "stop_reason": stats.stop_reason if stats else None,
+        "objective": stats.objective if stats else None,
+        "best_bound": stats.best_bound if stats else None,
+        "seconds": round(seconds, 3),
+    }
+
+
+def solve_aggregated(prob, x, groups, time_limit, warm_start, options):
+    """
+    Solve prob (built per commercial over x) through the aggregated
+    formulation. Returns (final solver, formulation summary); prob and x hold
+    the final stage's result.
+    """
+    y = aggregate_commercials(prob, x, groups)
+    grouped = [x[i] for idx in groups for i in idx]
+    start_ts = time.perf_counter()
+    stages = []
+
+    def run(name, warm):
+        remaining = time_limit - (time.perf_counter() - start_ts) if time_limit else None
+        limit = None if remaining is None else max(remaining, AGGREGATE_RECOVERY_MIN_SECONDS)
+        solver = make_solver(msg=True, timeLimit=limit, warmStart=warm, **options)
+        stage_start = time.perf_counter()
+        prob.solve(solver)
+        stages.append(_stage(name, solver, time.perf_counter() - stage_start))
+        return solver
+
+    solver = run('aggregated', warm_start)
+    bound = solver.stats.best_bound if solver.stats else None
+    relaxed_optimal = solver.stats is not None and solver.stats.stop_reason == 'optimal'
+    has_solution = prob.status == 1 and all(v.varValue is not None for v in y)
+
+    if has_solution:
+        round_allocation(x, y, groups)
+        for v in grouped:
+            v.cat = LpInteger
+        y_bounds = [(v.lowBound, v.upBound) for v in y]
+        for v in y:
+            v.lowBound = v.upBound = round(v.varValue)
+            v.setInitialValue(v.upBound)
+        starts = [v.varValue for v in x]
+        repair_start(prob, x)
+        solver = run('split', True)
+
+        if prob.status != 1 and not cancel_requested():
+            for v, (lo, up) in zip(y, y_bounds):
+                v.lowBound, v.upBound = lo, up
+            for v, value in zip(x, starts):
+                v.setInitialValue(value)
+            repair_start(prob, x)
+            solver = run('full', True)
+    else:
+        for v in grouped:
+            v.cat = LpInteger
+
+    objective = solver.stats.objective if solver.stats else None
+    gap = None
+    if relaxed_optimal and bound is not None and objective is not None:
+        # The relaxation's optimum bounds every integer plan
+        gap = max(0.0, bound - objective) / max(1e-9, abs(bound))
+    full_optimal = stages[-1]["stage"] == 'full' and solver.stats is not None and solver.stats.stop_reason == 'optimal'
+    return solver, {
+        "name": "aggregated",
+        "programs": len(groups),
+        "integer_variables": len(x) - len(grouped) + len(y),
+        "relaxation_bound": bound,
+        "gap": round(gap, 6) if gap is not None else None,
+        "proven_optimal": bool(full_optimal or (gap is not None and gap <= 1e-6)),
+        "stages": stages,
+    }
+
+
+def solve_formulation(prob, x, df, data, time_limit, warm_start, options):
+    """
+    prob.solve with the request's formulation. x holds the variable of every
+    df row (None for rows presolve fixed). Returns (solver, summary); summary
+    is None for the per-commercial model (or when nothing aggregates).
+    """
+    groups = program_groups(df) if request_formulation(data) == 'aggregated' else []
+    # Positions among the rows still in the model
+    column = np.cumsum([v is not None for v in x]) - 1
+    groups = [column[[i for i in idx if x[i] is not None]] for idx in groups]
+    groups = [idx for idx in groups if len(idx) > 1]
+    x = [v for v in x if v is not None]
+    if groups:
+        return solve_aggregated(prob, x, groups, time_limit, warm_start, options)
+    solver = make_solver(msg=True, timeLimit=time_limit, warmStart=warm_start, **options)
+    prob.solve(solver)
+    return solver, None
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from optimization import OPTIMIZERS
+from utils import digest, json_default
+
+# === Cache Settings ===
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 256))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Optional on-disk tier, shared by every worker process on the host
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Request keys that steer how a solve is run, not what is solved
+CONTROL_KEYS = {'async', 'fresh'}
+FRAME_KEYS = ('df_full', 'programRows', 'df_handle')
+
+_entries = OrderedDict()   # key -> (stored_at, json_text)
+_total_bytes = 0
+_lock = threading.Lock()
+
+
+# === Keys ===
+
+def frame_digest(records):
+    return digest(records or [])
+
+
+def result_cache_key(kind, data):
+    """Content hash of everything that defines the model for this endpoint."""
+    params = {k: v for k, v in data.items() if k not in CONTROL_KEYS and k not in FRAME_KEYS}
+    if data.get('df_handle'):
+        # Handles are content-addressed, so the handle itself identifies the frame
+        return digest(kind, params, data['df_handle'])
+    frame = next((data[k] for k in FRAME_KEYS if data.get(k)), [])
+    return digest(kind, params, frame_digest(frame))
+
+
+# === Memory Tier (LRU, bounded by entries and bytes) ===
+
+def _memory_get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+        return entry
+
+
+def _memory_put(key, entry):
+    global _total_bytes
+    size = len(entry[1])
+    if size > RESULT_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= len(old[1])
+        _entries[key] = entry
+        _total_bytes += size
+        while _entries and (len(_entries) > RESULT_CACHE_MAX_ENTRIES or _total_bytes > RESULT_CACHE_MAX_BYTES):
+            _, evicted = _entries.popitem(last=False)
+            _total_bytes -= len(evicted[1])
+
+
+# === Disk Tier ===
+
+def _disk_path(key):
+    return os.path.join(RESULT_CACHE_DIR, f"{key}.json")
+
+
+def _disk_get(key):
+    if not RESULT_CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        os.utime(path)  # mtime doubles as the LRU clock
+        return os.path.getmtime(path), text
+    except OSError:
+        return None
+
+
+def _disk_put(key, text):
+    if not RESULT_CACHE_DIR:
+        return
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_disk_path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, _disk_path(key))
+        _disk_evict()
+    except OSError as e:
+        print("Result cache disk write failed:", e)
+
+
+def _disk_evict():
+    files = []
+    for name in os.listdir(RESULT_CACHE_DIR):
+        if name.endswith(".json"):
+            st = os.stat(os.path.join(RESULT_CACHE_DIR, name))
+            files.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in files)
+    for _, size, name in sorted(files):
+        if total <= RESULT_CACHE_DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(RESULT_CACHE_DIR, name))
+        except OSError:
+            pass
+        total -= size
+
+
+# === Public API ===
+
+def cache_get(key):
+    entry = _memory_get(key)
+    if entry is None:
+        entry = _disk_get(key)
+        if entry is not None:
+            _memory_put(key, entry)
+    return entry
+
+
+def cache_put(key, body):
+    entry = (time.time(), json.dumps(body, default=json_default))
+    _memory_put(key, entry)
+    _disk_put(key, entry[1])
+
+
+def cache_stats():
+    with _lock:
+        return {"entries": len(_entries), "bytes": _total_bytes}
+
+
+# Stop reason -> PuLP status name, for responses without a solver_status (plan);
+# stops that keep an incumbent report "Optimal" the way PuLP does
+STOP_STATUS = {'infeasible': 'Infeasible', 'preflight': 'Infeasible', 'unbounded': 'Unbounded'}
+
+
+def result_status(body):
+    """
+    (stop_reason, is_optimal) of a stored response, from its solver_stats
+    (every endpoint has one; bonus and sweep responses hold one block per
+    channel / point). Optimal means every solve proved optimality on the
+    exact model: not a gap / time / stall stop, an unproven aggregated
+    formulation or a preview.
+    """
+    stats = body.get("solver_stats") or {}
+    if isinstance(stats.get("channels"), dict):
+        blocks = list(stats["channels"].values())
+    elif isinstance(stats.get("points"), list):
+        blocks = stats["points"]
+    else:
+        blocks = [stats] if stats else []
+    reasons = {block.get("stop_reason") for block in blocks}
+    proven = all((block.get("formulation") or {}).get("proven_optimal", True) for block in blocks)
+    is_optimal = bool(blocks) and reasons == {'optimal'} and proven and not body.get("approximate") \
+        and body.get("success") is not False
+    stop_reason = reasons.pop() if len(reasons) == 1 else ("mixed" if reasons else None)
+    return stop_reason, is_optimal
+
+
+def run_cached(kind, data):
+    """
+    Run an optimizer through the result cache.
+    Pass "fresh": true to bypass a stored result (e.g. one that hit the time limit);
+    the fresh result replaces it.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return OPTIMIZERS[kind](data)
+
+    key = result_cache_key(kind, data)
+    entry = None if data.get('fresh') else cache_get(key)
+    if entry is not None:
+        stored_at, text = entry
+        body = json.loads(text)
+        stop_reason, is_optimal = result_status(body)
+        body["cache"] = {
+            "hit": True,
+            "key": key,
+            "stored_at": stored_at,
+            "solver_status": body.get("solver_status") or STOP_STATUS.get(
+                stop_reason, "Optimal" if body.get("success") else "Not Solved"),
+            "stop_reason": stop_reason,
+            "is_optimal": is_optimal,
+        }
+        return body, 200
+
+    body, status = OPTIMIZERS[kind](data)
+    # Only completed solves are cached; time-limited ones keep their status in the body.
+    # A cancelled solve stopped at whatever the user settled for, so it is never stored.
+    if status == 200 and not body.get("cancelled"):
+        cache_put(key, body)
+        body["cache"] = {"hit": False, "key": key}
+    return body, status
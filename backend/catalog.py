@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+from database import db_connection
+
+# === Catalog Settings ===
+# Target-group rating columns on the programs table (selectable as "target_group")
+TVR_COLUMNS = [
+    "tvr_all",
+    "tvr_abc_15_90",
+    "tvr_abc_30_60",
+    "tvr_abc_15_30",
+    "tvr_abc_20_plus",
+    "tvr_ab_15_plus",
+    "tvr_cd_15_plus",
+    "tvr_ab_female_15_45",
+    "tvr_abc_15_60",
+    "tvr_bcde_15_plus",
+    "tvr_abcde_15_plus",
+    "tvr_abc_female_15_60",
+    "tvr_abc_male_15_60",
+]
+NUMERIC_COLUMNS = ['is_weekend', 'cost', 'net_cost', 'cargills_rate']
+TEXT_COLUMNS = ['channel', 'day', 'time', 'program', 'slot']
+
+# Minimum seconds between version checks (0 = check on every call)
+CATALOG_CHECK_SECONDS = float(os.environ.get("CATALOG_CHECK_SECONDS", 0))
+
+_snapshot = None
+_checked_at = 0.0
+_schema_ready = False
+_lock = threading.Lock()
+
+
+# === Version Counter ===
+
+def _ensure_version_table(cursor):
+    global _schema_ready
+    if _schema_ready:
+        return
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        """
+    )
+    cursor.execute("INSERT IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+    _schema_ready = True
+
+
+def _read_version(cursor):
+    _ensure_version_table(cursor)
+    cursor.execute("SELECT version FROM catalog_version WHERE id = 1")
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def bump_catalog_version(cursor):
+    """Call from every write path on `programs`, after the writes, so all workers reload."""
+    _ensure_version_table(cursor)
+    cursor.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    invalidate_catalog()
+
+
+def invalidate_catalog():
+    global _checked_at
+    _checked_at = 0.0
+
+
+# === Snapshot ===
+
+class CatalogSnapshot:
+    """
+    Immutable copy of the programs table.
+    `rows` keeps the raw DB rows (ordered by channel, slot, program) for the
+    listing endpoints; the columnar arrays and the tvr matrix serve frame building.
+    """
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.rows = rows
+        self.loaded_at = time.time()
+
+        n = len(rows)
+        self.ids = np.array([r['id'] for r in rows], dtype=np.int64)
+        self.index_of = {int(pid): pos for pos, pid in enumerate(self.ids)}
+        self.columns = {}
+        for col in TEXT_COLUMNS:
+            values = np.empty(n, dtype=object)
+            values[:] = [r.get(col) for r in rows]
+            self.columns[col] = values
+        for col in NUMERIC_COLUMNS:
+            self.columns[col] = _float_column(rows, col)
+        # One (programs x target groups) matrix; column order follows TVR_COLUMNS
+        self.tvr = np.empty((n, len(TVR_COLUMNS)))
+        for j, col in enumerate(TVR_COLUMNS):
+            self.tvr[:, j] = _float_column(rows, col)
+
+        # Listing helpers (DB collation order is preserved from the ORDER BY)
+        self.channels = list(dict.fromkeys(r['channel'] for r in rows))
+        self._id_order = np.argsort(self.ids, kind='stable')
+
+    def programs_for_channel(self, channel):
+        key = str(channel).rstrip().casefold()
+        return [
+            self.rows[pos] for pos in self._id_order
+            if str(self.rows[pos]['channel']).rstrip().casefold() == key
+        ]
+
+    def frame(self, program_ids, tg, columns):
+        """
+        DataFrame of the requested programs (id order, like WHERE id IN (...)),
+        with `tg` exposed as column 'tvr'.
+        """
+        pos = sorted({self.index_of[int(p)] for p in program_ids if _is_int(p) and int(p) in self.index_of},
+                     key=lambda i: self.ids[i])
+        pos = np.asarray(pos, dtype=np.int64)
+        data = {}
+        for col in columns:
+            if col == 'id':
+                data[col] = self.ids[pos]
+            elif col == 'tvr':
+                data[col] = self.tvr[pos, TVR_COLUMNS.index(tg)]
+            else:
+                data[col] = self.columns[col][pos]
+        return pd.DataFrame(data).infer_objects()
+
+
+def _float_column(rows, col):
+    # DECIMAL/NULL/blank cells -> float64 with NaN, the same coercion generate-df applies
+    return pd.to_numeric(pd.Series([r.get(col) for r in rows], dtype=object),
+                         errors='coerce').to_numpy(dtype=float)
+
+
+def _is_int(value):
+    try:
+        int(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _load_snapshot(version):
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM programs ORDER BY channel, slot, program;")
+        rows = cursor.fetchall()
+    return CatalogSnapshot(rows, version)
+
+
+def get_catalog():
+    """
+    Current catalog snapshot for this process. One cheap version query per call
+    (at most every CATALOG_CHECK_SECONDS) decides whether to reload.
+    """
+    global _snapshot, _checked_at
+    now = time.time()
+    if _snapshot is not None and now - _checked_at < CATALOG_CHECK_SECONDS:
+        return _snapshot
+
+    with db_connection() as conn:
+        version = _read_version(conn.cursor())
+
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _load_snapshot(version)
+        _checked_at = now
+        return _snapshot
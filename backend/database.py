@@ -1 +1,173 @@
- 
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+# === Pool Settings ===
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))      # max seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))      # reopen connections older than this
+
+
+def connect():
+    """Open a raw connection (the pool uses this; nothing else should need to)."""
+    return mysql.connector.connect(
+        host=os.environ.get("DB_HOST", "127.0.0.1"),
+        port=int(os.environ.get("DB_PORT", 3306)),
+        user=os.environ.get("DB_USER", "root"),
+        password=os.environ.get("DB_PASS", ""),
+        database=os.environ.get("DB_NAME", "optimization"),
+        autocommit=True
+    )
+
+
+# === Connection Pool ===
+
+class ConnectionPool:
+    """
+    Bounded pool of MySQL connections for one process.
+    Connections are pinged on checkout and reopened once older than DB_POOL_RECYCLE.
+    """
+
+    def __init__(self, size, timeout, recycle):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = queue.LifoQueue()          # (conn, created_at)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._created_at = {}
+        self.in_use = 0
+        self.opened = 0
+        self.recycled = 0
+        self.failed_checks = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _open(self):
+        conn = connect()
+        with self._lock:
+            self.opened += 1
+        return conn, time.time()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def checkout(self):
+        if not self._slots.acquire(blocking=False):
+            start_ts = time.perf_counter()
+            acquired = self._slots.acquire(timeout=self.timeout)
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - start_ts
+                if not acquired:
+                    self.timeouts += 1
+            if not acquired:
+                raise errors.PoolError(f"No database connection available within {self.timeout}s")
+
+        try:
+            conn, created_at = self._idle.get_nowait()
+        except queue.Empty:
+            conn, created_at = None, None
+
+        try:
+            if conn is not None and time.time() - created_at > self.recycle:
+                self._discard(conn)
+                conn = None
+                with self._lock:
+                    self.recycled += 1
+            if conn is not None:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._discard(conn)
+                    conn = None
+                    with self._lock:
+                        self.failed_checks += 1
+            if conn is None:
+                conn, created_at = self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.in_use += 1
+            self._created_at[id(conn)] = created_at
+        return conn
+
+    def release(self, conn, healthy=True):
+        if healthy:
+            # A half-read result set would break the next borrower's first query
+            try:
+                if conn.unread_result:
+                    conn.consume_results()
+            except Exception:
+                healthy = False
+        with self._lock:
+            self.in_use -= 1
+            created_at = self._created_at.pop(id(conn), time.time())
+        if healthy:
+            self._idle.put((conn, created_at))
+        else:
+            self._discard(conn)
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "idle": self._idle.qsize(),
+                "opened": self.opened,
+                "recycled": self.recycled,
+                "failed_health_checks": self.failed_checks,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 4),
+                "timeouts": self.timeouts,
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Built lazily so every gunicorn worker gets its own pool after fork
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrow a pooled connection for the duration of a with-block.
+    The connection always goes back to the pool; if the block raised, it is
+    rolled back first and dropped if that fails.
+    """
+    pool = get_pool()
+    conn = pool.checkout()
+    healthy = True
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            healthy = False
+        raise
+    finally:
+        pool.release(conn, healthy)
@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import stat
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# === Frame Store Settings ===
+# Expanded df_full frames kept server-side so clients can pass a df_handle
+# instead of posting the whole table back. Memory is per process; the disk
+# copy lets any gunicorn worker on the host resolve the handle.
+# Disk copies are column arrays in an .npz read with allow_pickle=False (no
+# pickle: a planted file can't run code), in a directory that must be owned
+# by this user with no group / other access; otherwise the disk tier is off.
+FRAME_STORE_DIR = os.environ.get("FRAME_STORE_DIR") or os.path.join(tempfile.gettempdir(), "opt_frames")
+FRAME_TTL_SECONDS = int(os.environ.get("FRAME_TTL_SECONDS", 4 * 3600))
+FRAME_STORE_MAX_BYTES = int(os.environ.get("FRAME_STORE_MAX_BYTES", 512 * 1024 * 1024))
+FRAME_STORE_DISK_MAX_BYTES = int(os.environ.get("FRAME_STORE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+HANDLE_RE = re.compile(r'^df_[0-9a-f]{32}$')
+
+_frames = OrderedDict()   # handle -> (expires_at, nbytes, df)
+_total_bytes = 0
+_lock = threading.Lock()
+
+
+def frame_handle(df):
+    """Content-addressed handle: identical frames map to the same handle."""
+    h = hashlib.sha256()
+    h.update(','.join(map(str, df.columns)).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return "df_" + h.hexdigest()[:32]
+
+
+FRAME_SUFFIX = ".npz"
+
+
+def _disk_path(handle):
+    return os.path.join(FRAME_STORE_DIR, f"{handle}{FRAME_SUFFIX}")
+
+
+# === Memory Tier ===
+
+def _memory_put(handle, df, expires_at):
+    global _total_bytes
+    nbytes = int(df.memory_usage(deep=True).sum())
+    if nbytes > FRAME_STORE_MAX_BYTES:
+        return
+    with _lock:
+        old = _frames.pop(handle, None)
+        if old is not None:
+            _total_bytes -= old[1]
+        _frames[handle] = (expires_at, nbytes, df)
+        _total_bytes += nbytes
+
+        now = time.time()
+        for h in [h for h, (exp, _, _) in _frames.items() if exp <= now]:
+            _total_bytes -= _frames.pop(h)[1]
+        while _frames and _total_bytes > FRAME_STORE_MAX_BYTES:
+            _, (_, evicted_bytes, _) = _frames.popitem(last=False)
+            _total_bytes -= evicted_bytes
+
+
+def _memory_get(handle):
+    global _total_bytes
+    with _lock:
+        entry = _frames.get(handle)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            _total_bytes -= _frames.pop(handle)[1]
+            return None
+        _frames.move_to_end(handle)
+        return entry[2]
+
+
+# === Disk Format ===
+# One array per column: numeric / bool columns as they are, categoricals as
+# codes + categories, anything else as the JSON text of each value (exact
+# for floats). The column list and dtypes go in a JSON "meta" entry.
+
+def _encode(values, key, arrays):
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        arrays[key] = np.asarray(values.cat.codes)
+        return {"kind": "category", "ordered": bool(dtype.ordered),
+                "categories": _encode(pd.Series(dtype.categories), f"{key}_cats", arrays)}
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        arrays[key] = values.to_numpy()
+        return {"kind": "numeric"}
+    arrays[key] = np.array([json.dumps(None if v is pd.NA or v is pd.NaT else v, default=str)
+                            for v in values.tolist()], dtype=str)
+    return {"kind": "json", "dtype": str(dtype)}
+
+
+def _decode(spec, key, arrays):
+    if spec["kind"] == "category":
+        categories = _decode(spec["categories"], f"{key}_cats", arrays)
+        return pd.Series(pd.Categorical.from_codes(arrays[key], categories=categories, ordered=spec["ordered"]))
+    if spec["kind"] == "numeric":
+        return pd.Series(arrays[key])
+    values = pd.Series([json.loads(v) for v in arrays[key].tolist()], dtype=object)
+    return values if spec["dtype"] == "object" else values.astype(spec["dtype"])
+
+
+def _write_frame(df, path):
+    arrays = {}
+    columns = [[name, _encode(df[name], f"c{i}", arrays)] for i, name in enumerate(df.columns)]
+    index = None
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        index = _encode(df.index.to_series(), "index", arrays)
+    arrays["meta"] = np.array(json.dumps({"columns": columns, "index": index, "rows": len(df)}))
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _read_frame(path):
+    with np.load(path, allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    meta = json.loads(str(arrays["meta"]))
+    df = pd.DataFrame({name: _decode(spec, f"c{i}", arrays) for i, (name, spec) in enumerate(meta["columns"])},
+                      index=pd.RangeIndex(meta["rows"]))
+    if meta["index"] is not None:
+        df.index = pd.Index(_decode(meta["index"], "index", arrays))
+    return df
+
+
+# === Disk Tier ===
+
+def _store_dir():
+    """FRAME_STORE_DIR, created 0700; None (disk tier off) when another user could write to it."""
+    try:
+        os.makedirs(FRAME_STORE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(FRAME_STORE_DIR)
+    except OSError as e:
+        print("Frame store directory unavailable:", e)
+        return None
+    if not stat.S_ISDIR(st.st_mode):
+        print(f"Frame store disabled: {FRAME_STORE_DIR} is not a directory")
+        return None
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+        print(f"Frame store disabled: {FRAME_STORE_DIR} must be owned by this user with mode 0700")
+        return None
+    return FRAME_STORE_DIR
+
+
+def _disk_put(handle, df):
+    if _store_dir() is None:
+        return
+    try:
+        tmp_path = f"{_disk_path(handle)}.{os.getpid()}.tmp"
+        _write_frame(df, tmp_path)
+        os.replace(tmp_path, _disk_path(handle))
+        _disk_evict()
+    except (OSError, TypeError, ValueError) as e:
+        print("Frame store disk write failed:", e)
+
+
+def _disk_get(handle):
+    if _store_dir() is None:
+        return None
+    path = _disk_path(handle)
+    try:
+        if os.path.getmtime(path) + FRAME_TTL_SECONDS <= time.time():
+            os.remove(path)
+            return None
+        df = _read_frame(path)
+        os.utime(path)  # sliding expiry
+        return df
+    except (OSError, EOFError, KeyError, ValueError, TypeError):
+        return None
+
+
+def _disk_evict():
+    now = time.time()
+    files = []
+    for name in os.listdir(FRAME_STORE_DIR):
+        if not name.endswith(FRAME_SUFFIX):
+            continue
+        path = os.path.join(FRAME_STORE_DIR, name)
+        try:
+            st = os.stat(path)
+            if st.st_mtime + FRAME_TTL_SECONDS <= now:
+                os.remove(path)
+                continue
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= FRAME_STORE_DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+# === Public API ===
+
+def store_frame(df):
+    """Keep df server-side; returns (handle, expires_at)."""
+    handle = frame_handle(df)
+    expires_at = time.time() + FRAME_TTL_SECONDS
+    _memory_put(handle, df, expires_at)
+    _disk_put(handle, df)
+    return handle, expires_at
+
+
+def load_frame(handle):
+    """Return a private copy of the stored frame, or None if unknown/expired."""
+    if not isinstance(handle, str) or not HANDLE_RE.match(handle):
+        return None
+    df = _memory_get(handle)
+    if df is None:
+        df = _disk_get(handle)
+        if df is None:
+            return None
+        _memory_put(handle, df, time.time() + FRAME_TTL_SECONDS)
+    else:
+        # Access extends the TTL in both tiers
+        with _lock:
+            if handle in _frames:
+                _, nbytes, _ = _frames[handle]
+                _frames[handle] = (time.time() + FRAME_TTL_SECONDS, nbytes, df)
+        try:
+            os.utime(_disk_path(handle))
+        except OSError:
+            pass
+    return df.copy()
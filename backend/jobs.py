@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import run_cached
+from solver import solve_monitor
+from utils import json_default
+
+# === Job Settings ===
+# The job table lives in a local SQLite file so every gunicorn worker on the
+# host sees the same jobs; the solves themselves run in a process pool.
+JOBS_DB_PATH = os.environ.get(
+    "JOBS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db")
+)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))              # pool size per gunicorn worker
+JOB_MAX_RUNNING = int(os.environ.get("JOB_MAX_RUNNING", JOB_WORKERS))  # running solves per host
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 24 * 3600))
+# A running job's worker renews its lease every JOB_HEARTBEAT_SECONDS; a job whose
+# worker process is gone, or whose lease is older than JOB_LEASE_SECONDS, is failed
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", 10))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+# Minimum seconds between solver progress writes per solve (incumbent changes and the end of search always go through)
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", 0.5))
+
+# queued -> running -> done | failed | cancelled
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+_executor = None
+_executor_pid = None
+_schema_ready = False
+
+
+# === Job Table ===
+
+def _connect():
+    global _schema_ready
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS optimization_jobs (
+                id          TEXT PRIMARY KEY,
+                kind        TEXT NOT NULL,
+                status      TEXT NOT NULL,
+                http_status INTEGER,
+                result      TEXT,
+                error       TEXT,
+                created_at  REAL NOT NULL,
+                started_at  REAL,
+                finished_at REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                worker_pid  INTEGER,
+                heartbeat_at REAL
+            )
+            """
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(optimization_jobs)")}
+        if "cancel_requested" not in columns:
+            # Job tables created before cancellation existed
+            conn.execute("ALTER TABLE optimization_jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        if "worker_pid" not in columns:
+            # Job tables created before running jobs held a lease
+            conn.execute("ALTER TABLE optimization_jobs ADD COLUMN worker_pid INTEGER")
+            conn.execute("ALTER TABLE optimization_jobs ADD COLUMN heartbeat_at REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON optimization_jobs (status)")
+        # Latest solver progress per solve of a job (a bonus job has one solve per channel).
+        # id is the SSE event id: every write (INSERT OR REPLACE included) takes the next
+        # one in commit order, so it orders events across processes whose clocks may not.
+        progress_columns = {row["name"] for row in conn.execute("PRAGMA table_info(job_progress)")}
+        if progress_columns and "id" not in progress_columns:
+            # Progress tables keyed by (job_id, solve) only; their rows are short-lived
+            conn.execute("DROP TABLE job_progress")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_progress (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id     TEXT NOT NULL,
+                solve      TEXT NOT NULL,
+                progress   TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (job_id, solve)
+            )
+            """
+        )
+        _schema_ready = True
+    return conn
+
+
+def _finish_job(job_id, status, body, http_status, error=None):
+    conn = _connect()
+    conn.execute(
+        """
+        UPDATE optimization_jobs
+        SET status = ?, http_status = ?, result = ?, error = ?, finished_at = ?
+        WHERE id = ?
+        """,
+        (status, http_status, json.dumps(body, default=json_default), error, time.time(), job_id)
+    )
+    conn.close()
+
+
+def _pid_alive(pid):
+    if pid is None or os.name != 'posix':
+        return True  # nothing to check; the lease decides
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reap_stale_jobs(conn):
+    """
+    Fail running jobs left behind by a worker that died or was recycled: its
+    process is gone, or it stopped renewing the lease (pids get reused).
+    """
+    now = time.time()
+    rows = conn.execute(
+        "SELECT id, worker_pid, heartbeat_at FROM optimization_jobs WHERE status = 'running'"
+    ).fetchall()
+    for row in rows:
+        if (row["heartbeat_at"] or 0.0) > now - JOB_LEASE_SECONDS and _pid_alive(row["worker_pid"]):
+            continue
+        error = "The worker running this job stopped before it finished"
+        conn.execute(
+            """
+            UPDATE optimization_jobs
+            SET status = 'failed', http_status = 500, result = ?, error = ?, finished_at = ?
+            WHERE id = ? AND status = 'running' AND heartbeat_at IS ?
+            """,
+            (json.dumps({"success": False, "error": error}), error, now, row["id"], row["heartbeat_at"])
+        )
+
+
+def _keep_lease(job_id, stop):
+    """Renew the job's lease until `stop` is set; runs beside the solve."""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        conn = _connect()
+        conn.execute(
+            "UPDATE optimization_jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+            (time.time(), job_id)
+        )
+        conn.close()
+
+
+def _claim_slot(job_id):
+    """
+    Block until fewer than JOB_MAX_RUNNING jobs are running on this host, then
+    mark ours running under this process's lease. False if the job was
+    cancelled while it waited.
+    """
+    conn = _connect()
+    try:
+        while True:
+            _reap_stale_jobs(conn)
+            now = time.time()
+            cur = conn.execute(
+                """
+                UPDATE optimization_jobs
+                SET status = 'running', started_at = ?, worker_pid = ?, heartbeat_at = ?
+                WHERE id = ? AND status = 'queued'
+                  AND (SELECT COUNT(*) FROM optimization_jobs WHERE status = 'running') < ?
+                """,
+                (now, os.getpid(), now, job_id, JOB_MAX_RUNNING)
+            )
+            if cur.rowcount == 1:
+                return True
+            row = conn.execute("SELECT status FROM optimization_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] != 'queued':
+                return False
+            time.sleep(0.25)
+    finally:
+        conn.close()
+
+
+# === Progress ===
+
+class JobMonitor:
+    """
+    Solve monitor for a job: stores the latest progress event of each solve in
+    job_progress for /jobs/<id>/events. Picklable, so bonus channel workers can
+    report under the same job.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._written_at = {}
+
+    def __getstate__(self):
+        return {"job_id": self.job_id}
+
+    def __setstate__(self, state):
+        self.__init__(state["job_id"])
+
+    def on_progress(self, event):
+        solve = event["solve"]
+        now = time.time()
+        if event["event"] in ('nodes', 'root') and now - self._written_at.get(solve, 0.0) < JOB_PROGRESS_INTERVAL:
+            return
+        self._written_at[solve] = now
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO job_progress (job_id, solve, progress, updated_at) VALUES (?, ?, ?, ?)",
+            (self.job_id, solve, json.dumps(event), now)
+        )
+        conn.close()
+
+    def should_cancel(self):
+        conn = _connect()
+        row = conn.execute("SELECT cancel_requested FROM optimization_jobs WHERE id = ?", (self.job_id,)).fetchone()
+        conn.close()
+        return bool(row and row["cancel_requested"])
+
+
+# === Worker ===
+
+def _run_job(job_id, kind, data):
+    """Executed inside a pool process."""
+    if not _claim_slot(job_id):
+        return
+    stop = threading.Event()
+    threading.Thread(target=_keep_lease, args=(job_id, stop), daemon=True).start()
+    solve_monitor.set(JobMonitor(job_id))
+    try:
+        body, http_status = run_cached(kind, data)
+        _finish_job(job_id, 'cancelled' if body.get('cancelled') else 'done', body, http_status)
+    except Exception as e:
+        traceback.print_exc()
+        _finish_job(job_id, 'failed', {"success": False, "error": str(e)}, 500, error=str(e))
+    finally:
+        stop.set()
+
+
+def _get_executor():
+    # Created lazily so each gunicorn worker builds its own pool after fork
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _on_job_done(job_id):
+    def callback(future):
+        exc = future.exception()
+        if exc is not None:
+            # The pool itself failed (e.g. a worker process died mid-solve)
+            _finish_job(job_id, 'failed', {"success": False, "error": str(exc)}, 500, error=str(exc))
+    return callback
+
+
+# === Public API ===
+
+def submit_job(kind, data):
+    """Persist a queued job, hand it to the process pool and return its id."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+
+    conn = _connect()
+    conn.execute(
+        "DELETE FROM optimization_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+        (now - JOB_RETENTION_SECONDS,)
+    )
+    conn.execute("DELETE FROM job_progress WHERE updated_at < ?", (now - JOB_RETENTION_SECONDS,))
+    _reap_stale_jobs(conn)
+    conn.execute(
+        "INSERT INTO optimization_jobs (id, kind, status, created_at) VALUES (?, ?, 'queued', ?)",
+        (job_id, kind, now)
+    )
+    conn.close()
+
+    future = _get_executor().submit(_run_job, job_id, kind, data)
+    future.add_done_callback(_on_job_done(job_id))
+    return job_id
+
+
+def get_job(job_id):
+    """Return the job row (with the decoded result once finished), or None."""
+    conn = _connect()
+    row = conn.execute("SELECT * FROM optimization_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is not None and row["status"] == 'running':
+        _reap_stale_jobs(conn)
+        row = conn.execute("SELECT * FROM optimization_jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+
+    job = {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+    if row["status"] in FINISHED_STATUSES:
+        job["http_status"] = row["http_status"]
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+        if row["error"]:
+            job["error"] = row["error"]
+    return job
+
+
+def cancel_job(job_id):
+    """
+    Ask a job to stop. A queued job is finished as cancelled straight away; a
+    running one has its solver interrupted by the worker and ends as
+    'cancelled' with the incumbent it had. Returns the job's status, or None.
+    """
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT status FROM optimization_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row["status"] in FINISHED_STATUSES:
+            return row["status"]
+        conn.execute("UPDATE optimization_jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        body = {"success": False, "cancelled": True, "message": "Cancelled before the solve started"}
+        cur = conn.execute(
+            """
+            UPDATE optimization_jobs
+            SET status = 'cancelled', http_status = 200, result = ?, finished_at = ?
+            WHERE id = ? AND status = 'queued'
+            """,
+            (json.dumps(body), time.time(), job_id)
+        )
+        return 'cancelled' if cur.rowcount == 1 else 'running'
+    finally:
+        conn.close()
+
+
+def get_job_progress(job_id, since=0):
+    """
+    Latest progress event of each solve in the job written after event id
+    `since`, as (id, event) oldest first; the id is the SSE event id.
+    """
+    conn = _connect()
+    rows = conn.execute(
+        "SELECT id, progress FROM job_progress WHERE job_id = ? AND id > ? ORDER BY id",
+        (job_id, since)
+    ).fetchall()
+    conn.close()
+    return [(row["id"], json.loads(row["progress"])) for row in rows]
@@ -0,0 +1,148 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from pulp import LpStatusNotSolved
+
+from frames import frame_handle
+
+# === Model Template Settings ===
+# Consecutive requests of one session usually post the same df_full and only
+# change scalars (budget, budget_bound, prime_pct, one channel's share). The
+# emitted PuLP problem is kept per process, keyed on the frame fingerprint and
+# the model's sparsity pattern; the next request with the same key moves the
+# bounds, coefficients and right-hand sides in place instead of creating every
+# LpVariable and constraint again.
+MODEL_TEMPLATES_ENABLED = os.environ.get("MODEL_TEMPLATES_ENABLED", "1") == "1"
+MODEL_TEMPLATE_MAX_ENTRIES = int(os.environ.get("MODEL_TEMPLATE_MAX_ENTRIES", 8))
+MODEL_TEMPLATE_TTL_SECONDS = int(os.environ.get("MODEL_TEMPLATE_TTL_SECONDS", 4 * 3600))
+
+_templates = OrderedDict()   # key -> (expires_at, entry)
+_lock = threading.Lock()
+
+
+def request_fingerprint(data, df):
+    """Fingerprint of the request's frame: its df_handle when given (handles are content-addressed)."""
+    return data.get('df_handle') or frame_handle(df)
+
+
+def template_key(fingerprint, model):
+    """Frame fingerprint + everything that fixes the PuLP structure (names, senses, sparsity)."""
+    indptr, indices, _ = model.to_csr()
+    h = hashlib.sha256()
+    for part in (fingerprint, model.name, '\x00'.join(model.var_names), ''.join(model.row_sense)):
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\x00')
+    h.update(indptr.tobytes())
+    h.update(indices.tobytes())
+    return h.hexdigest()
+
+
+# === Store (per process, LRU) ===
+
+def _checkout(key):
+    # A template is used by one solve at a time: it leaves the store until released
+    with _lock:
+        entry = _templates.pop(key, None)
+    if entry is None or entry[0] <= time.time():
+        return None
+    return entry[1]
+
+
+def _checkin(key, entry):
+    with _lock:
+        _templates[key] = (time.time() + MODEL_TEMPLATE_TTL_SECONDS, entry)
+        _templates.move_to_end(key)
+        now = time.time()
+        for k in [k for k, (exp, _) in _templates.items() if exp <= now]:
+            del _templates[k]
+        while len(_templates) > MODEL_TEMPLATE_MAX_ENTRIES:
+            _templates.popitem(last=False)
+
+
+# === Templates ===
+
+class _Entry:
+    """An emitted PuLP problem and the SparseModel values it currently holds."""
+
+    def __init__(self, model):
+        self.prob, self.x = model.to_pulp()
+        self.constraints = list(self.prob.constraints.values())
+        self.keep(model, model.to_csr()[2])
+
+    def keep(self, model, data):
+        self.obj, self.lb, self.ub = model.obj.copy(), model.lb.copy(), model.ub.copy()
+        self.coef = data.copy()
+        self.rhs = np.array(model.row_rhs, dtype=float)
+
+    def update(self, model):
+        """Move the problem onto `model`'s values; returns how many of each changed."""
+        x = self.x
+        bounds = np.flatnonzero((model.lb != self.lb) | (model.ub != self.ub))
+        for j in bounds.tolist():
+            x[j].lowBound, x[j].upBound = float(model.lb[j]), float(model.ub[j])
+        self.prob.objective_scale = model.obj_scale
+        objective = np.flatnonzero(model.obj != self.obj)
+        for j in objective.tolist():
+            self.prob.objective[x[j]] = float(model.obj[j])
+
+        indptr, indices, data = model.to_csr()
+        coefficients = np.flatnonzero(data != self.coef)
+        if len(coefficients):
+            rows = np.searchsorted(indptr, coefficients, side='right') - 1
+            for k, r in zip(coefficients.tolist(), rows.tolist()):
+                self.constraints[r].expr[x[indices[k]]] = float(data[k])
+        rhs = np.array(model.row_rhs, dtype=float)
+        changed_rhs = np.flatnonzero(rhs != self.rhs)
+        for r in changed_rhs.tolist():
+            self.constraints[r].changeRHS(float(rhs[r]))
+
+        # Nothing of the previous solve may leak into this one
+        for v in x:
+            v.varValue = None
+        self.prob.assignStatus(LpStatusNotSolved)
+        self.keep(model, data)
+        return {"bounds": len(bounds), "objective": len(objective),
+                "coefficients": len(coefficients), "rhs": len(changed_rhs)}
+
+
+class ModelTemplate:
+    """
+    A request's handle on the session's model template:
+        template = ModelTemplate(fingerprint)
+        prob, x = template.emit(model)      # reused and updated, or emitted
+        ... solve, read x ...
+        template.release()                  # back to the store for the next request
+    """
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.key = None
+        self.entry = None
+        self.reused = False
+        self.changed = None
+
+    def emit(self, model):
+        if MODEL_TEMPLATES_ENABLED and self.fingerprint:
+            self.key = template_key(self.fingerprint, model)
+            self.entry = _checkout(self.key)
+        if self.entry is not None:
+            self.reused = True
+            self.changed = self.entry.update(model)
+        else:
+            self.entry = _Entry(model)
+        return self.entry.prob, self.entry.x
+
+    def release(self):
+        if self.key is not None and self.entry is not None:
+            _checkin(self.key, self.entry)
+        self.key = None
+
+    def summary(self):
+        summary = {"reused": self.reused}
+        if self.changed is not None:
+            summary["changed"] = self.changed
+        return summary
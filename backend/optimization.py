@@ -1 +1,2094 @@
- 
+import os
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+from pulp import (
+    LpProblem, LpMaximize, LpVariable, LpAffineExpression, LpConstraint,
+    LpConstraintEQ, LpConstraintGE, LpConstraintLE, LpStatus,
+)
+
+from frames import load_frame
+from model_templates import ModelTemplate, request_fingerprint
+from warm_start import warm_start_spots, apply_warm_start, repair_start
+from aggregation import solve_formulation, request_formulation
+from preview import solve_preview, request_mode
+from solver import (
+    make_solver, solve_monitor, run_with_monitor, cancel_requested, solver_stats, rejected_stats,
+    SOLVER_BACKENDS,
+)
+
+
+SENSES = {
+    '>=': LpConstraintGE,
+    '<=': LpConstraintLE,
+    '==': LpConstraintEQ,
+}
+
+
+def to_int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# === Sparse Model ===
+
+class SparseModel:
+    """
+    Column-oriented MILP description.
+
+    Variables are held as NumPy arrays (objective, bounds) and every constraint
+    is a sparse row of (column positions, coefficients, sense, rhs), so the
+    model can be inspected or transformed before any PuLP objects exist.
+    """
+
+    def __init__(self, name, var_names, obj, lb, ub):
+        self.name = name
+        self.var_names = list(var_names)
+        self.obj = np.asarray(obj, dtype=float)
+        self.lb = np.asarray(lb, dtype=float)
+        self.ub = np.asarray(ub, dtype=float)
+        self.row_idx = []
+        self.row_coef = []
+        self.row_sense = []
+        self.row_rhs = []
+        self.row_group = []
+        # Groups with no variables whose constant constraint already fails
+        self.infeasible_groups = []
+        # Factor obj was multiplied by (see Scaling); solvers report objective values divided back
+        self.obj_scale = 1.0
+
+    @property
+    def n_vars(self):
+        return len(self.var_names)
+
+    @property
+    def n_rows(self):
+        return len(self.row_rhs)
+
+    def add_row(self, idx, coef, sense, rhs, group=''):
+        idx = np.asarray(idx, dtype=np.int64)
+        if len(idx) == 0:
+            ok = {'>=': 0 >= rhs, '<=': 0 <= rhs, '==': rhs == 0}[sense]
+            if not ok:
+                self.infeasible_groups.append(group)
+            return
+        self.row_idx.append(idx)
+        self.row_coef.append(np.broadcast_to(np.asarray(coef, dtype=float), idx.shape))
+        self.row_sense.append(sense)
+        self.row_rhs.append(float(rhs))
+        self.row_group.append(group)
+
+    def add_range(self, idx, coef, lo, hi, group=''):
+        """Two rows, lo <= coef·x <= hi (kept separate to match the original model)."""
+        self.add_row(idx, coef, '>=', lo, group)
+        self.add_row(idx, coef, '<=', hi, group)
+
+    def add_fix_zero(self, idx, group=''):
+        for i in idx:
+            self.add_row([i], 1.0, '==', 0.0, group)
+
+    def add_var_cap(self, idx, cap, group=''):
+        for i in idx:
+            self.add_row([i], 1.0, '<=', cap, group)
+
+    def to_csr(self):
+        """Return the constraint matrix as CSR arrays (indptr, indices, data)."""
+        lengths = [len(r) for r in self.row_idx]
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if self.row_idx:
+            indices = np.concatenate(self.row_idx)
+            data = np.concatenate(self.row_coef)
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+            data = np.zeros(0, dtype=float)
+        return indptr, indices, data
+
+    def to_pulp(self):
+        """Emit the equivalent PuLP problem; returns (prob, variables in column order)."""
+        prob = LpProblem(self.name, LpMaximize)
+        prob.objective_scale = self.obj_scale
+        x = [
+            LpVariable(n, lowBound=lo, upBound=up, cat='Integer')
+            for n, lo, up in zip(self.var_names, self.lb.tolist(), self.ub.tolist())
+        ]
+        prob += LpAffineExpression(zip(x, self.obj.tolist()))
+
+        for idx, coef, sense, rhs in zip(self.row_idx, self.row_coef, self.row_sense, self.row_rhs):
+            expr = LpAffineExpression(zip([x[j] for j in idx.tolist()], coef.tolist()))
+            prob += LpConstraint(expr, SENSES[sense], rhs=rhs)
+        return prob, x
+
+
+# === Group Indices ===
+
+def slot_class(df):
+    """0 = prime (slot A*), 1 = non-prime (slot B), 2 = anything else."""
+    slot = df['Slot']
+    prime = slot.str.startswith('A', na=False).to_numpy()
+    nonprime = (slot == 'B').to_numpy()
+    return np.where(prime, 0, np.where(nonprime, 1, 2))
+
+
+def build_group_index(df):
+    """
+    Precompute every constraint group used by the share models once:
+    channel, channel × slot class, commercial, channel × commercial and
+    channel × weekend, as arrays of row positions.
+    """
+    channel = df['Channel'].to_numpy()
+    slot_cls = slot_class(df)
+    weekend = pd.to_numeric(df['IsWeekend'], errors='coerce').fillna(0).to_numpy() == 1
+    has_commercial = 'Commercial' in df.columns
+    commercial = df['Commercial'].to_numpy() if has_commercial else np.zeros(len(df), dtype=int)
+
+    def groups(**cols):
+        frame = pd.DataFrame(cols)
+        return frame.groupby(list(cols), sort=False, dropna=False).indices
+
+    return {
+        'channel': groups(channel=channel),
+        'channel_slot': groups(channel=channel, slot=slot_cls),
+        'commercial': groups(commercial=commercial) if has_commercial else {},
+        'channel_commercial': groups(channel=channel, commercial=commercial) if has_commercial else {},
+        'channel_weekend': groups(channel=channel, weekend=weekend),
+    }
+
+
+# === Plan Model ===
+
+def parse_plan_params(data):
+    """Normalise the /optimize payload into plain Python values."""
+    return {
+        'total_budget': float(data.get('budget') or 0),
+        'budget_bound': float(data.get('budget_bound') or 0),
+        'min_spots': int(data.get('min_spots') or 0),
+        'max_spots': int(data.get('max_spots', 10)),
+        'num_commercials': int(data.get('num_commercials') or 1),
+        'budget_proportions': data.get('budget_proportions') or [],
+    }
+
+
+def build_plan_model(df, p):
+    """The /optimize MILP: total budget ± bound and per-commercial ±5% shares of it."""
+    ncost = df['NCost'].to_numpy(dtype=float)
+    total_budget = p['total_budget']
+    n = len(df)
+    model = SparseModel(
+        "Maximize_TVR", [f"x_{i}" for i in df.index], df['NTVR'].to_numpy(dtype=float),
+        np.full(n, p['min_spots'], dtype=float), np.full(n, p['max_spots'], dtype=float),
+    )
+    model.add_range(np.arange(n), ncost, total_budget - p['budget_bound'], total_budget + p['budget_bound'], 'total')
+
+    budget_proportions = p['budget_proportions']
+    if p['num_commercials'] > 1 and budget_proportions:
+        commercial = df['Commercial'].to_numpy()
+        for c in range(min(p['num_commercials'], len(budget_proportions))):
+            idx = np.flatnonzero(commercial == c)
+            share = float(budget_proportions[c]) / 100
+            model.add_range(idx, ncost[idx], (share - 0.05) * total_budget, (share + 0.05) * total_budget,
+                            f'commercial:{c}')
+    return model
+
+
+# === Budget Share Model ===
+
+def parse_budget_share_params(data):
+    """Normalise the /optimize-by-budget-share payload into plain Python values."""
+    return {
+        'budget_shares': data.get('budget_shares') or {},
+        'total_budget': float(data.get('budget', 0)),
+        'budget_bound': float(data.get('budget_bound', 0)),
+        'num_commercials': int(data.get('num_commercials', 1)),
+        'min_spots': int(data.get('min_spots', 0)),
+        'max_spots': int(data.get('max_spots', 10)),
+        'prime_pct': float(data.get('prime_pct', 80)),
+        'nonprime_pct': float(data.get('nonprime_pct', 20)),
+        'time_limit': int(data.get("time_limit", 120)),
+        'prime_map': data.get('channel_prime_pct_map') or {},
+        'nonprime_map': data.get('channel_nonprime_pct_map') or {},
+        'budget_proportions': data.get("budget_proportions", []) or [],
+        'channel_max_spots': data.get("channel_max_spots") or {},
+        'channel_weekend_max_spots': data.get("channel_weekend_max_spots") or {},
+        'channel_commercial_pct_map': data.get('channel_commercial_pct_map') or {},
+    }
+
+
+def build_budget_share_model(df, p):
+    """
+    Build the channel / slot / commercial budget-share MILP from the
+    precomputed group index. Produces the same variables and constraints,
+    in the same order, as the original per-row lpSum formulation.
+    """
+    groups = build_group_index(df)
+    ncost = df['NCost'].to_numpy(dtype=float)
+    ntvr = df['NTVR'].to_numpy(dtype=float)
+    channel = df['Channel'].to_numpy()
+
+    total_budget = p['total_budget']
+    num_commercials = p['num_commercials']
+    budget_proportions = p['budget_proportions']
+    channel_commercial_pct_map = p['channel_commercial_pct_map']
+
+    # Variable bounds: channel override → else global max
+    ub = np.full(len(df), p['max_spots'], dtype=float)
+    for ch in pd.unique(channel):
+        ch_cap = to_int_or_none(p['channel_max_spots'].get(ch))
+        if ch_cap is not None:
+            ub[channel == ch] = ch_cap
+    lb = np.full(len(df), p['min_spots'], dtype=float)
+
+    model = SparseModel(
+        "Maximize_TVR_With_Channel_and_Slot_Budget_Shares",
+        [f"x2_{i}" for i in df.index], ntvr, lb, ub,
+    )
+    empty = np.zeros(0, dtype=np.int64)
+
+    def cost_range(idx, lo, hi, group):
+        model.add_range(idx, ncost[idx], lo, hi, group)
+
+    # Total budget constraint
+    all_idx = np.arange(len(df))
+    cost_range(all_idx, total_budget - p['budget_bound'], total_budget + p['budget_bound'], 'total')
+
+    has_channel_commercial_overrides = isinstance(channel_commercial_pct_map, dict) and len(channel_commercial_pct_map) > 0
+
+    # Overall-plan commercial constraints (±5%) when no per-channel split is given
+    if (num_commercials > 1) and (not has_channel_commercial_overrides) and budget_proportions:
+        for c in range(min(len(budget_proportions), num_commercials)):
+            idx = groups['commercial'].get(c, empty)
+            if len(idx) == 0:
+                continue
+            share = float(budget_proportions[c]) / 100.0
+            cost_range(idx, (share - 0.05) * total_budget, (share + 0.05) * total_budget, f'commercial:{c}')
+
+    for ch, pct in p['budget_shares'].items():
+        we_cap = to_int_or_none(p['channel_weekend_max_spots'].get(ch))
+        if we_cap is not None:
+            model.add_var_cap(groups['channel_weekend'].get((ch, True), empty), we_cap, f'weekend_cap:{ch}')
+
+        ch_idx = groups['channel'].get(ch, empty)
+        if len(ch_idx) == 0:
+            continue
+
+        ch_budget = (float(pct) / 100.0) * total_budget
+        cost_range(ch_idx, 0.95 * ch_budget, 1.05 * ch_budget, f'channel:{ch}')
+
+        # PT / NPT (per-channel split, fallback to global)
+        for slot_cls, pct_map, global_pct, label in (
+            (0, p['prime_map'], p['prime_pct'], 'prime'),
+            (1, p['nonprime_map'], p['nonprime_pct'], 'nonprime'),
+        ):
+            idx = groups['channel_slot'].get((ch, slot_cls), empty)
+            slot_pct = float(pct_map.get(ch, global_pct))
+            if slot_pct == 0:
+                model.add_fix_zero(idx, f'{label}:{ch}')
+            else:
+                cost_range(idx, ((slot_pct / 100.0) - 0.05) * ch_budget,
+                           ((slot_pct / 100.0) + 0.05) * ch_budget, f'{label}:{ch}')
+
+        # Per-channel commercial budgets (±5%, pct == 0 forbids the commercial)
+        if has_channel_commercial_overrides and (num_commercials > 1):
+            ch_arr = channel_commercial_pct_map.get(ch)
+            if ch_arr is None:
+                ch_arr = budget_proportions
+            if not isinstance(ch_arr, (list, tuple)):
+                ch_arr = []
+
+            for c in range(num_commercials):
+                pct_c = None
+                if c < len(ch_arr):
+                    try:
+                        pct_c = float(ch_arr[c])
+                    except Exception:
+                        pct_c = None
+                if pct_c is None:
+                    pct_c = 100.0 / float(num_commercials)
+
+                idx = groups['channel_commercial'].get((ch, c), empty)
+                if len(idx) == 0:
+                    continue
+
+                target = (pct_c / 100.0) * ch_budget
+                if pct_c == 0:
+                    model.add_fix_zero(idx, f'channel_commercial:{ch}:{c}')
+                else:
+                    cost_range(idx, 0.95 * target, 1.05 * target, f'channel_commercial:{ch}:{c}')
+
+    return model
+
+
+# === Benefit Share Model ===
+
+def parse_benefit_share_params(data, benefit_channels):
+    """Normalise the /optimize-by-benefit-share payload, filling default commercial splits."""
+    num_commercials = int(data.get('num_commercials', 1))
+    budget_proportions = data.get('budget_proportions') or []
+    channel_commercial_pct_map = data.get('channel_commercial_pct_map') or {}
+
+    # Validate budget_proportions
+    if not budget_proportions and num_commercials > 1:
+        # Default equal split if not provided
+        budget_proportions = [100.0 / num_commercials] * num_commercials
+    else:
+        budget_proportions = [float(p) for p in budget_proportions]
+
+    # Validate channel_commercial_pct_map
+    for ch in benefit_channels:
+        if ch not in channel_commercial_pct_map:
+            # Use global budget_proportions as default
+            channel_commercial_pct_map[ch] = budget_proportions.copy()
+        else:
+            # Ensure array has correct length
+            arr = channel_commercial_pct_map[ch]
+            if isinstance(arr, list):
+                if len(arr) != num_commercials:
+                    # Pad with last value or equal split
+                    if len(arr) > 0:
+                        last_val = arr[-1]
+                        arr = arr + [last_val] * (num_commercials - len(arr))
+                    else:
+                        arr = budget_proportions.copy()
+                    channel_commercial_pct_map[ch] = arr
+
+    return {
+        'budget_shares': data.get('budget_shares') or {},
+        'total_budget': float(data.get('budget', 0)),
+        'budget_bound': float(data.get('budget_bound', 0)),
+        'num_commercials': num_commercials,
+        'channel_max_spots': data.get("channel_max_spots") or {},
+        'channel_weekend_max_spots': data.get("channel_weekend_max_spots") or {},
+        'min_spots': int(data.get('min_spots', 0)),
+        'max_spots': int(data.get('max_spots', 10)),
+        'prime_pct': float(data.get('prime_pct', 80)),
+        'nonprime_pct': float(data.get('nonprime_pct', 20)),
+        'time_limit': int(data.get("time_limit", 120)),
+        'channel_slot_pct_map': data.get('channel_slot_pct_map') or {},
+        'budget_proportions': budget_proportions,
+        'channel_commercial_pct_map': channel_commercial_pct_map,
+    }
+
+
+def build_benefit_share_model(df, p):
+    """
+    Build the benefit-share MILP (channel budgets, per-slot shares, channel ×
+    commercial splits, global commercial backup) with the same variables and
+    constraints, in the same order, as the original lpSum formulation.
+    """
+    ncost = df['NCost'].to_numpy(dtype=float)
+    ntvr = df['NTVR'].to_numpy(dtype=float)
+    channel = df['Channel'].to_numpy()
+    slot = df['Slot'].to_numpy()
+    weekend = pd.to_numeric(df['IsWeekend'], errors='coerce').fillna(0).to_numpy() == 1
+    has_commercial = 'Commercial' in df.columns
+    commercial = df['Commercial'].to_numpy() if has_commercial else None
+
+    total_budget = p['total_budget']
+    num_commercials = p['num_commercials']
+    budget_proportions = p['budget_proportions']
+
+    # Upper bound: channel cap → else global max, weekend cap on top
+    ub = np.full(len(df), p['max_spots'], dtype=float)
+    for ch in pd.unique(channel):
+        on_ch = channel == ch
+        ch_cap = to_int_or_none(p['channel_max_spots'].get(ch))
+        if ch_cap is not None:
+            ub[on_ch] = ch_cap
+        we_cap = to_int_or_none(p['channel_weekend_max_spots'].get(ch))
+        if we_cap is not None:
+            ub[on_ch & weekend] = np.minimum(ub[on_ch & weekend], we_cap)
+    lb = np.full(len(df), p['min_spots'], dtype=float)
+
+    model = SparseModel(
+        "Maximize_TVR_CommercialBenefit",
+        [f"x_ben_{i}" for i in df.index], ntvr, lb, ub,
+    )
+
+    def cost_range(idx, lo, hi, group):
+        model.add_range(idx, ncost[idx], lo, hi, group)
+
+    # Global Budget Constraint
+    cost_range(np.arange(len(df)), total_budget - p['budget_bound'], total_budget + p['budget_bound'], 'total')
+
+    for ch, pct in p['budget_shares'].items():
+        ch_idx = np.flatnonzero(channel == ch)
+        if len(ch_idx) == 0:
+            continue
+
+        target_ch_budget = (float(pct) / 100.0) * total_budget
+        cost_range(ch_idx, 0.95 * target_ch_budget, 1.05 * target_ch_budget, f'channel:{ch}')
+
+        # Slot shares (+/- 5%, lower clamped at 0); a 0% slot forces its spots to 0
+        ch_slot_pcts = p['channel_slot_pct_map'].get(ch, {'A': p['prime_pct'], 'B': p['nonprime_pct']})
+        ch_slots = slot[ch_idx]
+        for s in pd.unique(ch_slots):
+            idx = ch_idx[ch_slots == s]
+            if len(idx) == 0:
+                continue
+            slot_pct = float(ch_slot_pcts.get(s, 0))
+            if slot_pct == 0:
+                model.add_fix_zero(idx, f'slot:{ch}:{s}')
+                continue
+            lower_share = max(0, (slot_pct / 100.0) - 0.05)
+            upper_share = (slot_pct / 100.0) + 0.05
+            cost_range(idx, lower_share * target_ch_budget, upper_share * target_ch_budget, f'slot:{ch}:{s}')
+
+        # Channel × commercial splits
+        if num_commercials > 1:
+            ch_commercial_pcts = p['channel_commercial_pct_map'].get(ch, budget_proportions)
+            if len(ch_commercial_pcts) < num_commercials:
+                last_val = ch_commercial_pcts[-1] if ch_commercial_pcts else (100.0 / num_commercials)
+                ch_commercial_pcts = ch_commercial_pcts + [last_val] * (num_commercials - len(ch_commercial_pcts))
+
+            for comm_idx in range(num_commercials):
+                comm_pct = float(ch_commercial_pcts[comm_idx])
+                idx = ch_idx[commercial[ch_idx] == comm_idx]
+                if len(idx) == 0:
+                    continue
+                group = f'channel_commercial:{ch}:{comm_idx}'
+                if comm_pct == 0:
+                    model.add_fix_zero(idx, group)
+                elif comm_pct > 0:
+                    lower_share = max(0, (comm_pct / 100.0) - 0.05)
+                    upper_share = (comm_pct / 100.0) + 0.05
+                    cost_range(idx, lower_share * target_ch_budget, upper_share * target_ch_budget, group)
+                else:
+                    model.add_row(idx, ncost[idx], '==', 0.0, group)
+
+    # Global commercial split (backup to the per-channel splits)
+    if budget_proportions and num_commercials > 1 and has_commercial:
+        for c in range(num_commercials):
+            idx = np.flatnonzero(commercial == c)
+            if len(idx) == 0:
+                continue
+            share = float(budget_proportions[c]) / 100.0 if c < len(budget_proportions) else (1.0 / num_commercials)
+            cost_range(idx, (share - 0.05) * total_budget, (share + 0.05) * total_budget, f'commercial:{c}')
+
+    return model
+
+
+# === Bonus Channel Model ===
+
+def build_bonus_channel_model(channel, df_ch, params):
+    """One channel's bonus MILP: channel budget ± bound and per-commercial ±5% targets."""
+    ncost = df_ch['NCost'].to_numpy(dtype=float)
+    ntvr = df_ch['NTVR'].to_numpy(dtype=float)
+    commercial = df_ch['Commercial'].to_numpy()
+    weekend = pd.to_numeric(df_ch['IsWeekend'], errors='coerce').fillna(0).to_numpy() == 1
+    bonus_budget = params["bonus_budget"]
+    budget_bound = params["budget_bound"]
+
+    # Channel-specific per-program cap, weekend cap on top
+    ch_cap = to_int_or_none(params["ch_cap"])
+    if ch_cap is None:
+        ch_cap = params["max_spots"]
+    we_cap = to_int_or_none(params["we_cap"])
+    ub = np.full(len(df_ch), ch_cap, dtype=float)
+    if we_cap is not None:
+        ub[weekend] = min(ch_cap, we_cap)
+    lb = np.full(len(df_ch), params["min_spots"], dtype=float)
+
+    model = SparseModel(f"Maximize_NTVR_{channel}", [f"x_{i}" for i in df_ch.index], ntvr, lb, ub)
+
+    all_idx = np.arange(len(df_ch))
+    model.add_range(all_idx, ncost, bonus_budget - budget_bound, bonus_budget + budget_bound, f'channel:{channel}')
+
+    # Commercial-wise budget bounds; a 0 (or negative) target forces its spots to 0
+    for c in pd.unique(commercial):
+        idx = np.flatnonzero(commercial == c)
+        target = params["comm_budgets"].get(c, 0)
+        if target <= 0:
+            model.add_fix_zero(idx, f'commercial:{channel}:{c}')
+        else:
+            model.add_range(idx, ncost[idx], 0.95 * target, 1.05 * target, f'commercial:{channel}:{c}')
+
+    return model
+
+
+# === Preflight ===
+
+def fold_singletons(lb, ub, rows, indptr, indices, data, sense, rhs, tol=1e-6):
+    """
+    Tighten lb / ub in place with the single-variable rows `rows` (rounded
+    inwards: all variables are integer). Returns (rows folded, their variables);
+    rows with a zero coefficient are left out.
+    """
+    var = indices[indptr[rows]]
+    coef = data[indptr[rows]]
+    ok = coef != 0
+    rows, var, coef = rows[ok], var[ok], coef[ok]
+    if len(rows):
+        bound = rhs[rows] / coef
+        caps_upper = np.where(coef > 0, np.isin(sense[rows], ['<=', '==']), np.isin(sense[rows], ['>=', '==']))
+        caps_lower = np.where(coef > 0, np.isin(sense[rows], ['>=', '==']), np.isin(sense[rows], ['<=', '==']))
+        np.minimum.at(ub, var[caps_upper], np.floor(bound[caps_upper] + tol))
+        np.maximum.at(lb, var[caps_lower], np.ceil(bound[caps_lower] - tol))
+    return rows, var
+
+
+def preflight(model, tol=1e-6):
+    """
+    Bound-based feasibility screen, run before any solver is started.
+    Single-variable rows (x == 0, x <= cap) are folded into the bounds first;
+    then every row's achievable activity [min, max] over the bounds is checked
+    against its rhs. Returns the violated groups (empty list = nothing provably infeasible).
+    """
+    lb = model.lb.copy()
+    ub = model.ub.copy()
+    violations = [
+        {"group": g, "reason": "no programs in group"} for g in model.infeasible_groups
+    ]
+    if model.n_rows == 0:
+        return violations
+
+    indptr, indices, data = model.to_csr()
+    lengths = np.diff(indptr)
+    sense = np.array(model.row_sense)
+    rhs = np.array(model.row_rhs, dtype=float)
+
+    # Singleton rows → bounds (all variables are integer, so round inwards)
+    single, var = fold_singletons(lb, ub, np.flatnonzero(lengths == 1), indptr, indices, data, sense, rhs, tol)
+    if len(single):
+        crossed = np.flatnonzero(lb > ub)
+        if len(crossed):
+            groups = {}
+            for r, v in zip(single, var):
+                if lb[v] > ub[v]:
+                    groups.setdefault(model.row_group[r], int(v))
+            for g in groups:
+                violations.append({"group": g, "reason": "spot bounds conflict (minimum spots above a forced cap)"})
+            return violations
+
+    # Activity range of every row
+    row_of = np.repeat(np.arange(model.n_rows), lengths)
+    lo_part = np.where(data > 0, data * lb[indices], data * ub[indices])
+    hi_part = np.where(data > 0, data * ub[indices], data * lb[indices])
+    lo_part[data == 0] = 0.0
+    hi_part[data == 0] = 0.0
+    act_min = np.bincount(row_of, weights=lo_part, minlength=model.n_rows)
+    act_max = np.bincount(row_of, weights=hi_part, minlength=model.n_rows)
+
+    slack = tol * np.maximum(1.0, np.abs(rhs))
+    too_low = np.isin(sense, ['>=', '==']) & (act_max < rhs - slack)
+    too_high = np.isin(sense, ['<=', '==']) & (act_min > rhs + slack)
+
+    for r in np.flatnonzero(too_low | too_high):
+        violations.append({
+            "group": model.row_group[r],
+            "reason": (f"needs ≥ {rhs[r]:,.2f} but at most {act_max[r]:,.2f} is achievable" if too_low[r]
+                       else f"needs ≤ {rhs[r]:,.2f} but at least {act_min[r]:,.2f} is committed"),
+            "sense": sense[r],
+            "rhs": round(float(rhs[r]), 2),
+            "min_achievable": round(float(act_min[r]), 2),
+            "max_achievable": round(float(act_max[r]), 2),
+        })
+    return violations
+
+
+def preflight_failure(violations, seconds, stats=None):
+    """Response body for a request rejected by the preflight screen."""
+    body = {
+        "success": False,
+        "message": "⚠️ No feasible solution. Violated: " + "; ".join(
+            f"{v['group']} ({v['reason']})" for v in violations[:5]
+        ),
+        "solver_status": "Infeasible",
+        "preflight": {
+            "violations": violations,
+            "seconds": round(seconds, 4)
+        }
+    }
+    if stats is not None:
+        body["solver_stats"] = stats
+    return body
+
+
+# === Scaling ===
+# Budgets run to tens of millions of LKR and NCost to six figures while NTVR
+# is a fraction, so the cost rows and the objective sit many orders of
+# magnitude apart. After presolve every row is divided by a power of two near
+# the geometric mean of its |coefficients| (rhs alike), and the objective is
+# multiplied by one that brings its coefficients near 1. Powers of two are
+# exact in floating point, the variables are not touched (they stay integer
+# spot counts, read back as they are), and the solver layer divides reported
+# objective values by the problem's objective_scale.
+# Off by default: both CBC and HiGHS scale internally, and dividing the
+# integer cost rows by 2^k makes them fractional, which weakens CBC's
+# preprocessing and cuts (budget-share solves measured slower on both
+# backends). /model-diagnostics reports what scaling would do either way.
+SCALING_ENABLED = os.environ.get("SCALING_ENABLED", "0") == "1"
+
+
+def power_of_two(values):
+    """2^round(log2(geometric mean of |values|)), 1.0 for no nonzero values."""
+    values = np.abs(np.asarray(values, dtype=float))
+    values = values[values > 0]
+    if not len(values):
+        return 1.0
+    return float(2.0 ** np.round(np.log2(np.sqrt(values.min() * values.max()))))
+
+
+def scale_model(model):
+    """A copy of `model` with scaled rows and objective; returns (scaled model, row scales)."""
+    row_scale = np.array([power_of_two(coef) for coef in model.row_coef])
+    obj_scale = 1.0 / power_of_two(model.obj)
+    scaled = SparseModel(model.name, model.var_names, model.obj * obj_scale, model.lb.copy(), model.ub.copy())
+    scaled.obj_scale = model.obj_scale * obj_scale
+    scaled.row_idx = list(model.row_idx)
+    scaled.row_coef = [coef / scale for coef, scale in zip(model.row_coef, row_scale.tolist())]
+    scaled.row_sense = list(model.row_sense)
+    scaled.row_rhs = (np.asarray(model.row_rhs, dtype=float) / row_scale).tolist()
+    scaled.row_group = list(model.row_group)
+    scaled.infeasible_groups = list(model.infeasible_groups)
+    return scaled, row_scale
+
+
+def value_range(values):
+    """min / max of the nonzero |values| and log10(max / min); None when all are zero."""
+    values = np.abs(np.asarray(values, dtype=float))
+    values = values[(values > 0) & np.isfinite(values)]
+    if not len(values):
+        return None
+    lo, hi = float(values.min()), float(values.max())
+    return {"min": lo, "max": hi, "ratio_log10": round(float(np.log10(hi / lo)), 2)}
+
+
+def coefficient_ranges(model):
+    """
+    Coefficient ranges of a SparseModel: the whole matrix, right-hand sides,
+    objective and finite upper bounds, plus matrix / rhs per kind of row
+    (the part of its group before the first ':', e.g. channel, slot, commercial).
+    """
+    _, _, data = model.to_csr()
+    rhs = np.array(model.row_rhs, dtype=float)
+    kinds = {}
+    for r, group in enumerate(model.row_group):
+        kinds.setdefault(str(group).split(':')[0] or 'other', []).append(r)
+    return {
+        "matrix": value_range(data),
+        "rhs": value_range(rhs),
+        "objective": value_range(model.obj),
+        "upper_bounds": value_range(model.ub),
+        "by_kind": {
+            kind: {
+                "rows": len(rows),
+                "matrix": value_range(np.concatenate([model.row_coef[r] for r in rows])),
+                "rhs": value_range(rhs[rows]),
+            }
+            for kind, rows in kinds.items()
+        },
+    }
+
+
+def matrix_ratio_log10(model):
+    ranges = value_range(model.to_csr()[2])
+    return ranges["ratio_log10"] if ranges else 0.0
+
+
+# === Presolve ===
+# Shared by every optimize endpoint, after the preflight screen passed and
+# before PuLP is emitted:
+#   - single-variable rows (x == 0 from a 0% share, x <= cap) become bounds,
+#     and rows forcing all their variables to 0 (ncost·x == 0) are folded too;
+#   - every bound is tightened against the budget rows it takes part in
+#     (global, channel, slot, commercial): a program whose NCost lets the
+#     channel's 1.05 × budget buy two spots gets upBound 2, not max_spots;
+#   - variables fixed by their bounds leave the model, their value moving
+#     into the right-hand sides; rows left without variables are dropped
+#     (with a model template they stay, lb == ub, so its structure holds);
+#   - identical columns (same rows, coefficients and objective: programs with
+#     the same channel, slot, commercial, weekend flag, cost and TVR) become
+#     one variable whose bounds are the members' sums (exact for integers).
+# Zero-rating programs are kept: they may be needed to reach a minimum spend.
+PRESOLVE_ENABLED = os.environ.get("PRESOLVE_ENABLED", "1") == "1"
+# Bound-tightening passes over the rows (each pass can enable the next)
+PRESOLVE_TIGHTEN_PASSES = int(os.environ.get("PRESOLVE_TIGHTEN_PASSES", 3))
+
+
+class Presolved:
+    """A presolved SparseModel plus the map back to the original variables."""
+
+    def __init__(self, original, model, column, lb, ub, kept_rows, rhs_offset, seconds):
+        self.model = model
+        self.column = column            # original variable -> reduced column, -1 when fixed
+        self.lb, self.ub = lb, ub       # original variables' bounds after folding
+        self.kept_rows = kept_rows      # original row of every reduced row
+        self.rhs_offset = rhs_offset    # fixed variables' activity in every reduced row
+        self.row_scale = np.ones(model.n_rows)   # every reduced row's divisor (see Scaling)
+        self.members = {}
+        for j, c in enumerate(column.tolist()):
+            if c >= 0:
+                self.members.setdefault(c, []).append(j)
+        fixed = int((column < 0).sum())
+        self.stats = {
+            "variables_before": original.n_vars,
+            "variables_after": model.n_vars,
+            "rows_before": original.n_rows,
+            "rows_after": model.n_rows,
+            "fixed_variables": fixed,
+            "merged_variables": original.n_vars - fixed - model.n_vars,
+            "seconds": round(seconds, 4),
+        }
+
+    @classmethod
+    def identity(cls, model, seconds=0.0):
+        return cls(model, model, np.arange(model.n_vars), model.lb.copy(), model.ub.copy(),
+                   np.arange(model.n_rows), np.zeros(model.n_rows), seconds)
+
+    def scale(self):
+        """Scale the reduced model (see Scaling); the original variables' map is unchanged."""
+        before = matrix_ratio_log10(self.model)
+        self.model, self.row_scale = scale_model(self.model)
+        self.stats.update({
+            "objective_scale": self.model.obj_scale,
+            "coefficient_ratio_log10_before": before,
+            "coefficient_ratio_log10_after": matrix_ratio_log10(self.model),
+        })
+        return self
+
+    def move_rhs(self, rhs):
+        """Set the reduced rows' rhs from the original rows' rhs (e.g. at another sweep budget)."""
+        moved = np.asarray(rhs, dtype=float)[self.kept_rows] - self.rhs_offset
+        self.model.row_rhs = (moved / self.row_scale).tolist()
+        return self.model.row_rhs
+
+    def expand(self, values):
+        """Original variables' values from the reduced columns' (None where there is no solution)."""
+        if all(v is None for v in values):
+            return [None] * len(self.column)
+        out = np.where(self.column < 0, self.lb, 0.0)
+        for c, members in self.members.items():
+            value = values[c]
+            if len(members) == 1:
+                out[members[0]] = value or 0.0
+                continue
+            # Merged: members at their lower bounds, the rest filled in order
+            left = round(value or 0.0) - self.lb[members].sum()
+            for j in members:
+                out[j] = self.lb[j] + min(left, self.ub[j] - self.lb[j])
+                left -= out[j] - self.lb[j]
+        return out.tolist()
+
+    def collapse(self, values):
+        """Reduced columns' values (e.g. a warm start) from the original variables'."""
+        return [sum(values[j] for j in self.members[c]) if all(values[j] is not None for j in self.members[c])
+                else None for c in range(self.model.n_vars)]
+
+    def row_variables(self, x):
+        """The reduced variable of every original variable (None when fixed); needs merge=False."""
+        return [x[c] if c >= 0 else None for c in self.column.tolist()]
+
+
+def tighten_bounds(lb, ub, rows, indptr, indices, data, sense, rhs, tol=1e-6):
+    """
+    Tighten lb / ub in place from the activity bounds of `rows`: in
+    sum_k a_k x_k <= u, a_j x_j <= u - (minimum activity of the others), and
+    likewise for >= rows and negative coefficients (rounded inwards: all
+    variables are integer). Returns the number of bounds tightened.
+    """
+    lengths = np.diff(indptr)
+    row_of = np.repeat(np.arange(len(lengths)), lengths)
+    entries = np.isin(row_of, rows) & (data != 0)
+    r, j, a = row_of[entries], indices[entries], data[entries]
+    upper = np.isin(sense[r], ['<=', '=='])
+    lower = np.isin(sense[r], ['>=', '=='])
+    tightened = 0
+    for _ in range(PRESOLVE_TIGHTEN_PASSES):
+        lo_part = np.where(a > 0, a * lb[j], a * ub[j])
+        hi_part = np.where(a > 0, a * ub[j], a * lb[j])
+        act_min = np.bincount(r, weights=lo_part, minlength=len(lengths))[r]
+        act_max = np.bincount(r, weights=hi_part, minlength=len(lengths))[r]
+        # Room left for a_j x_j once the rest of the row is at its minimum / maximum
+        with np.errstate(divide='ignore', invalid='ignore'):
+            from_upper = (rhs[r] - (act_min - lo_part)) / a
+            from_lower = (rhs[r] - (act_max - hi_part)) / a
+        new_ub, new_lb = ub.copy(), lb.copy()
+        caps = upper & (a > 0)
+        np.minimum.at(new_ub, j[caps], np.floor(from_upper[caps] + tol))
+        caps = lower & (a < 0)
+        np.minimum.at(new_ub, j[caps], np.floor(from_lower[caps] + tol))
+        floors = upper & (a < 0)
+        np.maximum.at(new_lb, j[floors], np.ceil(from_upper[floors] - tol))
+        floors = lower & (a > 0)
+        np.maximum.at(new_lb, j[floors], np.ceil(from_lower[floors] - tol))
+        changed = int((new_ub < ub).sum() + (new_lb > lb).sum())
+        if not changed:
+            break
+        ub[:], lb[:] = new_ub, new_lb
+        tightened += changed
+    return tightened
+
+
+def search_space_log10(lb, ub):
+    """log10 of the number of integer points in the box lb <= x <= ub."""
+    return float(np.log10(np.maximum(ub - lb + 1, 1)).sum())
+
+
+def presolve(model, merge=True, keep_rows=None, keep_columns=False, tol=1e-6):
+    """
+    Reduce `model` (see reduce_model), then scale what is left unless
+    SCALING_ENABLED is off. Returns a Presolved.
+    """
+    presolved = reduce_model(model, merge, keep_rows, keep_columns, tol)
+    return presolved.scale() if SCALING_ENABLED else presolved
+
+
+def reduce_model(model, merge=True, keep_rows=None, keep_columns=False, tol=1e-6):
+    """
+    Reduce `model` (see above). keep_rows marks rows that must stay rows
+    (e.g. single-variable rows whose rhs moves between sweep points).
+    keep_columns keeps variables the tightened bounds fix as columns with
+    lb == ub, and forcing rows as rows, so the reduced structure does not
+    depend on the budget or slot shares (a model template can be reused).
+    Returns a Presolved; the identity when PRESOLVE_ENABLED is off or
+    nothing would be left to solve.
+    """
+    start_ts = time.perf_counter()
+    if not PRESOLVE_ENABLED or model.n_rows == 0:
+        return Presolved.identity(model)
+
+    indptr, indices, data = model.to_csr()
+    lengths = np.diff(indptr)
+    sense = np.array(model.row_sense)
+    rhs = np.array(model.row_rhs, dtype=float)
+    movable = np.zeros(model.n_rows, dtype=bool) if keep_rows is None else np.asarray(keep_rows, dtype=bool)
+    lb, ub = model.lb.copy(), model.ub.copy()
+
+    folded = np.zeros(model.n_rows, dtype=bool)
+    rows, _ = fold_singletons(lb, ub, np.flatnonzero((lengths == 1) & ~movable), indptr, indices, data, sense, rhs, tol)
+    folded[rows] = True
+    # Forcing rows: positive coefficients over non-negative variables, capped at 0
+    forcing = np.zeros(model.n_rows, dtype=bool) if keep_columns else (np.abs(rhs) <= tol)
+    for r in np.flatnonzero((lengths > 1) & ~movable & np.isin(sense, ['<=', '==']) & forcing):
+        idx, coef = indices[indptr[r]:indptr[r + 1]], data[indptr[r]:indptr[r + 1]]
+        if (coef > 0).all() and (lb[idx] >= 0).all():
+            ub[idx] = 0.0
+            folded[r] = True
+    tightened = tighten_bounds(lb, ub, np.flatnonzero(~folded & ~movable), indptr, indices, data, sense, rhs, tol)
+
+    fixed = np.zeros(model.n_vars, dtype=bool) if keep_columns else lb == ub
+    if (lb == ub).all() or (lb > ub).any():
+        # Nothing left to solve, or crossed bounds: the solver reports the model as it is
+        return Presolved.identity(model, time.perf_counter() - start_ts)
+
+    # Remaining rows over the free variables, fixed activity moved to the rhs
+    row_of = np.repeat(np.arange(model.n_rows), lengths)
+    entry_free = ~fixed[indices]
+    offset = np.bincount(row_of, weights=np.where(entry_free, 0.0, data * lb[indices]), minlength=model.n_rows)
+    has_free = np.bincount(row_of, weights=entry_free, minlength=model.n_rows) > 0
+    constant = np.flatnonzero(~folded & ~has_free)
+    slack = tol * np.maximum(1.0, np.abs(rhs[constant]))
+    broken = (np.isin(sense[constant], ['>=', '==']) & (offset[constant] < rhs[constant] - slack)) | \
+             (np.isin(sense[constant], ['<=', '==']) & (offset[constant] > rhs[constant] + slack))
+    if broken.any():
+        return Presolved.identity(model, time.perf_counter() - start_ts)
+    kept_rows = np.flatnonzero(~folded & has_free)
+
+    # Column signatures over the kept rows: identical columns merge
+    free = np.flatnonzero(~fixed)
+    column = np.full(model.n_vars, -1, dtype=np.int64)
+    signature = {j: [model.obj[j]] for j in free.tolist()}
+    for r in kept_rows.tolist():
+        for j, a in zip(indices[indptr[r]:indptr[r + 1]].tolist(), data[indptr[r]:indptr[r + 1]].tolist()):
+            if not fixed[j]:
+                signature[j] += (r, a)
+    first = {}
+    for j in free.tolist():
+        key = tuple(signature[j]) if merge else j
+        column[j] = first.setdefault(key, len(first))
+
+    n_cols = len(first)
+    reduced_lb = np.zeros(n_cols)
+    reduced_ub = np.zeros(n_cols)
+    np.add.at(reduced_lb, column[free], lb[free])
+    np.add.at(reduced_ub, column[free], ub[free])
+    names = [None] * n_cols
+    obj = np.zeros(n_cols)
+    for j in free[::-1].tolist():   # first member names the column
+        names[column[j]] = model.var_names[j]
+        obj[column[j]] = model.obj[j]
+
+    reduced = SparseModel(model.name, names, obj, reduced_lb, reduced_ub)
+    reduced.infeasible_groups = list(model.infeasible_groups)
+    for r in kept_rows.tolist():
+        idx, coef = indices[indptr[r]:indptr[r + 1]], data[indptr[r]:indptr[r + 1]]
+        keep = ~fixed[idx]
+        cols, at = np.unique(column[idx[keep]], return_index=True)
+        reduced.add_row(cols, coef[keep][at], sense[r], rhs[r] - offset[r], model.row_group[r])
+    presolved = Presolved(model, reduced, column, lb, ub, kept_rows, offset[kept_rows], time.perf_counter() - start_ts)
+
+    before, after = search_space_log10(model.lb, model.ub), search_space_log10(lb, ub)
+    presolved.stats.update({
+        "tightened_bounds": tightened,
+        "search_space_log10_before": round(before, 2),
+        "search_space_log10_after": round(after, 2),
+    })
+    return presolved
+
+
+def timed_build(build, *args, emit=None, merge=True):
+    """
+    Run a model builder and the preflight screen, then presolve and emit PuLP
+    only if the screen passes (through `emit`, e.g. a ModelTemplate's, when
+    given; presolve then keeps fixed columns so the template's structure holds). Returns (model, prob, x, violations, seconds, presolved); x are
+    the presolved model's variables, prob / x / presolved are None when the
+    request was rejected.
+    """
+    start_ts = time.perf_counter()
+    model = build(*args)
+    violations = preflight(model)
+    if violations:
+        return model, None, None, violations, time.perf_counter() - start_ts, None
+    presolved = presolve(model, merge=merge, keep_columns=emit is not None)
+    prob, x = (emit or SparseModel.to_pulp)(presolved.model)
+    return model, prob, x, [], time.perf_counter() - start_ts, presolved
+
+
+# === Optimization Runners ===
+# Each runner takes the request payload and returns (response_body, http_status),
+# so it can run inside a request or in a job worker process.
+
+FRAME_EXPIRED = {
+    "success": False,
+    "error": "df_handle is unknown or has expired — regenerate the program table",
+    "df_handle_expired": True
+}
+
+
+def request_frame(data, *keys):
+    """df_full from a server-side df_handle, else from the inline records; None if the handle expired."""
+    handle = data.get('df_handle')
+    if handle:
+        df = load_frame(handle)
+        if df is None:
+            return None
+        # Generated frames keep text columns as categoricals; the solvers expect
+        # the same object columns they get from inline records
+        categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+        return df.astype({col: df[col].cat.categories.dtype for col in categorical}) if categorical else df
+    for key in (keys or ('df_full',)):
+        if data.get(key):
+            return pd.DataFrame(data[key])
+    return pd.DataFrame()
+
+def solver_options(data):
+    """
+    Solver settings from the request, as make_solver keyword arguments:
+      solver         -> backend, "cbc" or "highs" (default: SOLVER_BACKEND)
+      benchmark      -> also solve with the other backend and report both
+      gap_rel        -> stop at this relative MIP gap (0.01 = 1%)
+      gap_abs        -> stop at this absolute gap (objective units)
+      stall_seconds  -> stop once the incumbent has not improved for this long
+    Omitted or invalid values leave the default backend running to optimality / time_limit.
+    """
+    options = {}
+    backend = str(data.get('solver') or '').strip().lower()
+    if backend in SOLVER_BACKENDS:
+        options['backend'] = backend
+    if data.get('benchmark'):
+        options['benchmark'] = True
+    for key, option in (('gap_rel', 'gapRel'), ('gap_abs', 'gapAbs'), ('stall_seconds', 'stallSeconds')):
+        value = to_float_or_none(data.get(key))
+        if value is not None and value > 0:
+            options[option] = value
+    return options
+
+
+def started(warm_start):
+    """True when a warm start matched variables (the solver should read initial values)."""
+    return bool(warm_start and warm_start.get("applied"))
+
+
+def solve_plan(data):
+    df_full = request_frame(data)
+    if df_full is None:
+        return FRAME_EXPIRED, 410
+    params = parse_plan_params(data)
+    num_commercials = params['num_commercials']
+
+    if df_full.empty:
+        return {"error": "df_full is empty"}, 400
+
+    aggregated = request_formulation(data) == 'aggregated'
+    model, prob, x, violations, build_seconds, presolved = timed_build(
+        build_plan_model, df_full, params, merge=not aggregated)
+    if violations:
+        return preflight_failure(violations, build_seconds, rejected_stats('plan', model, build_seconds)), 200
+
+    time_limit = data.get("time_limit", 120)  # in seconds, default to 120 if not provided
+    warm_start = apply_warm_start(prob, df_full, x, *warm_start_spots(data), presolved=presolved)
+    solve_start = time.perf_counter()
+    solver, formulation = solve_formulation(prob, presolved.row_variables(x) if aggregated else x, df_full, data,
+                                            time_limit, started(warm_start), solver_options(data))
+    stats = solver_stats('plan', prob, solver, build_seconds, time.perf_counter() - solve_start,
+                         time_limit, warm_start, formulation, presolved.stats)
+    values = presolved.expand([v.varValue for v in x])
+    if prob.status != 1:
+        return {
+            "success": False,
+            "message": "⚠️ Optimization failed — no feasible solution found. Please check constraints or budget.",
+            "cancelled": solver.cancelled,
+            "solver_stats": stats
+        }, 200
+
+    df_full['Spots'] = [int(v) if v else 0 for v in values]
+    df_full['Total_Cost'] = df_full['Spots'] * df_full['NCost']
+    df_full['Total_Rating'] = df_full['Spots'] * df_full['NTVR']
+
+    # Round values
+    df_full[['Cost', 'TVR', 'NTVR', 'NCost', 'Total_Cost', 'Total_Rating']] = df_full[[
+        'Cost', 'TVR', 'NTVR', 'NCost', 'Total_Cost', 'Total_Rating'
+    ]].round(2)
+
+    # Filter out zero spots
+    df_full = df_full[df_full['Spots'] > 0].copy()
+
+    # Commercial-wise summary
+    commercials_summary = []
+    for c in range(num_commercials):
+        df_c = df_full[df_full['Commercial'] == c].copy()
+        if df_c.empty:
+            continue
+
+        df_c['Slot_Order'] = df_c['Slot'].map({'A': 0, 'B': 1})
+        df_c = df_c.sort_values(by=['Channel', 'Slot_Order', 'Program']).drop(columns='Slot_Order')
+
+        total_cost_c = df_c['Total_Cost'].sum()
+        total_rating_c = df_c['Total_Rating'].sum()
+        cprp_c = total_cost_c / total_rating_c if total_rating_c else None
+
+        details_safe = json.loads(df_c.to_json(orient='records'))
+
+        commercials_summary.append({
+            "commercial_index": c,
+            "total_cost": round(total_cost_c, 2),
+            "total_rating": round(total_rating_c, 2),
+            "cprp": round(cprp_c, 2) if cprp_c else None,
+            #"details": df_c.to_dict(orient='records')
+            "details": details_safe
+        })
+
+    # Channel summary
+    channel_summary = df_full.groupby('Channel')['Total_Cost'].sum().reset_index()
+    total_cost_all = df_full['Total_Cost'].sum()
+    channel_summary['% of Total'] = (channel_summary['Total_Cost'] / total_cost_all * 100).round(2)
+
+    # Convert ALL NumPy types to native Python types
+    total_cost_all_native = float(total_cost_all)
+    total_rating_native = float(df_full['Total_Rating'].sum())
+
+    # Convert commercials_summary
+    for commercial in commercials_summary:
+        commercial["total_cost"] = float(commercial["total_cost"])
+        commercial["total_rating"] = float(commercial["total_rating"])
+        if commercial["cprp"] is not None:
+            commercial["cprp"] = float(commercial["cprp"])
+
+    # Convert channel_summary (it seems safe based on debug, but let's be sure)
+    channel_summary_safe = json.loads(channel_summary.to_json(orient='records'))
+
+    return {
+        "success": True,
+        "total_cost": round(total_cost_all_native, 2),
+        "total_rating": round(total_rating_native, 2),
+        "cprp": round(total_cost_all_native / total_rating_native, 2) if total_rating_native else None,
+        "commercials_summary": commercials_summary,
+        "channel_summary": channel_summary_safe,
+        "df_result": json.loads(df_full.to_json(orient='records')),
+        "cancelled": solver.cancelled,
+        "solver_stats": stats
+    }, 200
+
+
+def solve_budget_share(data):
+    df_full = request_frame(data)
+    if df_full is None:
+        return FRAME_EXPIRED, 410
+    params = parse_budget_share_params(data)
+    budget_shares = params['budget_shares']
+    num_commercials = params['num_commercials']
+    time_limit = params['time_limit']
+    budget_proportions = params['budget_proportions']
+    channel_commercial_pct_map = params['channel_commercial_pct_map']
+
+    if df_full.empty or not budget_shares:
+        return {"error": "Missing data"}, 400
+
+    # Safety: ensure required columns exist
+    required_cols = {'NCost', 'NTVR', 'Channel', 'Slot' , 'IsWeekend'}
+    missing = required_cols - set(df_full.columns)
+    if missing:
+        return {"error": f"Missing columns in df_full: {sorted(missing)}"}, 400
+
+    # If any commercial split is supplied (global or per-channel), we need the Commercial column
+    commercial_required = (num_commercials > 1) and (budget_proportions or channel_commercial_pct_map)
+    if commercial_required and ('Commercial' not in df_full.columns):
+        return {"error": "Commercial splits provided, but 'Commercial' column missing"}, 400
+
+    # Model construction works on precomputed group index arrays (see optimization.py);
+    # the PuLP problem of the session's previous request on this frame is updated in place
+    # (the aggregated formulation adds rows, so it always starts from a fresh problem)
+    aggregated = request_formulation(data) == 'aggregated'
+    template = ModelTemplate(None if aggregated else request_fingerprint(data, df_full))
+    # (its program groups need one variable per row, so presolve merges nothing then)
+    model, prob, x, violations, build_seconds, presolved = timed_build(
+        build_budget_share_model, df_full, params, emit=template.emit, merge=not aggregated)
+    if violations:
+        return preflight_failure(violations, build_seconds, rejected_stats('budget-share', model, build_seconds)), 200
+
+    preview = request_mode(data) == 'preview'
+    warm_start = None if preview else apply_warm_start(prob, df_full, x, *warm_start_spots(data), presolved=presolved)
+
+    start_ts = time.time()
+    if preview:
+        # LP relaxation rounded to whole spots (see preview.py)
+        solver, approximation = solve_preview(prob, x, presolved.model, solver_options(data))
+        formulation = None
+    else:
+        solver, formulation = solve_formulation(prob, presolved.row_variables(x) if aggregated else x, df_full, data,
+                                                time_limit, started(warm_start), solver_options(data))
+        approximation = None
+    elapsed = time.time() - start_ts
+
+    # Taken from what the solver reported (see solver.SolveStats)
+    hit_time_limit = solver.stats.hit_time_limit
+    stats = solver_stats('budget-share', prob, solver, build_seconds, elapsed, time_limit, warm_start, formulation,
+                         presolved.stats)
+
+    status_str = LpStatus[prob.status]
+    values = presolved.expand([v.varValue for v in x])
+    template.release()
+    has_solution = any((v is not None and v > 0) for v in values)
+
+    # Cancelled, gap and stall stops end like a time limit: the incumbent is kept, optimality is unproven
+    stopped_early = hit_time_limit or solver.cancelled or solver.stats.stop_reason in ('gap', 'stall')
+    if formulation is not None and not formulation["proven_optimal"]:
+        # The split stage is optimal for its fixed totals only
+        stopped_early = True
+    if approximation is not None:
+        stopped_early = True
+    is_optimal = (status_str == 'Optimal') and (not stopped_early)
+    feasible_but_not_optimal = (status_str == 'Not Solved') or stopped_early
+
+    if status_str in ('Infeasible', 'Unbounded', 'Undefined'):
+        return {
+            "success": False,
+            "message": f"⚠️ No feasible solution. Solver status: {status_str}",
+            "solver_status": status_str,
+            "cancelled": solver.cancelled,
+            "solver_stats": stats
+        }, 200
+
+    if not has_solution:
+        return {
+            "success": False,
+            "message": "⚠️ No feasible solution found (no incumbent).",
+            "solver_status": status_str,
+            "cancelled": solver.cancelled,
+            "solver_stats": stats
+        }, 200
+
+    df_full['Spots'] = [int(v) if v else 0 for v in values]
+    df_full['Total_Cost'] = df_full['Spots'] * df_full['NCost']
+    df_full['Total_Rating'] = df_full['Spots'] * df_full['NTVR']
+
+    cols_to_round = ['Cost', 'TVR', 'NTVR', 'NCost', 'Total_Cost', 'Total_Rating']
+    for c in (set(cols_to_round) & set(df_full.columns)):
+        df_full[c] = df_full[c].astype(float).round(2)
+    df_full = df_full[df_full['Spots'] > 0].copy()
+
+    commercials_summary = []
+    if 'Commercial' in df_full.columns:
+        for c in range(num_commercials):
+            df_c = df_full[df_full['Commercial'] == c].copy()
+            if df_c.empty:
+                continue
+            df_c['Slot_Order'] = df_c['Slot'].map({'A': 0, 'B': 1}).fillna(2)
+            df_c = df_c.sort_values(by=['Channel', 'Slot_Order', 'Program']).drop(columns='Slot_Order', errors='ignore')
+
+            total_cost_c = df_c['Total_Cost'].sum()
+            total_rating_c = df_c['Total_Rating'].sum()
+            cprp_c = (total_cost_c / total_rating_c) if total_rating_c else None
+
+            commercials_summary.append({
+                "commercial_index": c,
+                "total_cost": round(total_cost_c, 2),
+                "total_rating": round(total_rating_c, 2),
+                "cprp": round(cprp_c, 2) if cprp_c else None,
+                "details": df_c.to_dict(orient='records')
+            })
+
+    total_rating = float(df_full['Total_Rating'].sum())
+    total_cost_all = float(df_full['Total_Cost'].sum())
+
+    channel_summary = []
+    for ch in df_full['Channel'].unique():
+        df_ch = df_full[df_full['Channel'] == ch]
+        ch_cost = float(df_ch['Total_Cost'].sum())
+        ch_rating = float(df_ch['Total_Rating'].sum())
+        ch_prime = df_ch[df_ch['Slot'].str.startswith('A', na=False)]
+        ch_nonprime = df_ch[df_ch['Slot'] == 'B']
+        prime_cost_val = float(ch_prime['Total_Cost'].sum())
+        nonprime_cost_val = float(ch_nonprime['Total_Cost'].sum())
+        prime_rating_val = float(ch_prime['Total_Rating'].sum())
+        nonprime_rating_val = float(ch_nonprime['Total_Rating'].sum())
+
+        channel_summary.append({
+            'Channel': ch,
+            'Total_Cost': round(ch_cost, 2),
+            '% Cost': round((ch_cost / total_cost_all * 100), 2) if total_cost_all else 0,
+            'Total_Rating': round(ch_rating, 2),
+            '% Rating': round((ch_rating / total_rating * 100), 2) if total_rating else 0,
+            'Prime Cost': round(prime_cost_val, 2),
+            'Non-Prime Cost': round(nonprime_cost_val, 2),
+            'Prime Rating': round(prime_rating_val, 2),
+            'Non-Prime Rating': round(nonprime_rating_val, 2),
+            'Prime Cost %': round((prime_cost_val / ch_cost * 100), 2) if ch_cost else 0,
+            'Non-Prime Cost %': round((nonprime_cost_val / ch_cost * 100), 2) if ch_cost else 0
+        })
+
+    return {
+        "success": True,
+        "total_cost": float(round(total_cost_all, 2)),
+        "total_rating": float(round(total_rating, 2)),
+        "cprp": float(round(total_cost_all / total_rating, 2)) if total_rating else None,
+        "channel_summary": channel_summary,
+        "commercials_summary": [
+            {
+                **{k: v for k, v in c.items() if k != "details"},
+                "details": json.loads(pd.DataFrame(c["details"]).to_json(orient="records"))
+                if isinstance(c.get("details"), list) else json.loads(c["details"].to_json(orient="records"))
+            }
+            for c in commercials_summary
+        ],
+        "df_result": json.loads(df_full.to_json(orient="records")),
+        "is_optimal": bool(is_optimal),
+        "feasible_but_not_optimal": bool(feasible_but_not_optimal),
+        "approximate": preview,
+        **({"approximation": approximation} if preview else {}),
+        "solver_status": str(status_str),
+        "hit_time_limit": bool(hit_time_limit),
+        "cancelled": solver.cancelled,
+        "timing": {
+            "build_seconds": round(build_seconds, 3),
+            "solve_seconds": round(elapsed, 3),
+            "model_template": template.summary()
+        },
+        "solver_stats": stats
+    }, 200
+
+
+def benefit_share_frame(df_full, benefit_channels):
+    """The rows of the selected (commercial benefit) channels, numeric columns sanitized."""
+    # Filter for selected channels (only those with commercial benefit)
+    if 'Channel' in df_full.columns:
+        df_full = df_full[df_full['Channel'].isin(benefit_channels)].copy()
+
+    # Sanitize numeric columns
+    for col in ['NCost', 'NTVR', 'Cost', 'TVR']:
+        if col in df_full.columns:
+            df_full[col] = pd.to_numeric(df_full[col], errors='coerce').fillna(0.0)
+    return df_full
+
+
+def solve_benefit_share(data):
+    """
+    Optimizes schedule based on Benefit Share percentages with channel-specific commercial splits.
+    """
+    try:
+        # --- 1. DATA PREPARATION & SANITIZATION ---
+        df_full = request_frame(data)
+        if df_full is None:
+            return FRAME_EXPIRED, 410
+        budget_shares = data.get('budget_shares') or {}
+        benefit_channels = list(budget_shares.keys())
+
+        df_full = benefit_share_frame(df_full, benefit_channels)
+
+        # Parse Parameters (fills default per-channel commercial splits)
+        params = parse_benefit_share_params(data, benefit_channels)
+        num_commercials = params['num_commercials']
+        time_limit = params['time_limit']
+
+        # Basic Validation
+        if df_full.empty or not budget_shares:
+            return {"error": "Missing data or empty selection"}, 400
+
+        required_cols = {'NCost', 'NTVR', 'Channel', 'Slot' , 'IsWeekend'}
+        missing = required_cols - set(df_full.columns)
+        if missing:
+            return {"error": f"Missing columns in df_full: {sorted(missing)}"}, 400
+
+        if num_commercials > 1 and 'Commercial' not in df_full.columns:
+            return {"error": "Commercial column missing when num_commercials > 1"}, 400
+
+        # --- 2-4. MODEL (channel & slot shares, commercial splits) + preflight ---
+        model, prob, x, violations, build_seconds, presolved = timed_build(build_benefit_share_model, df_full, params)
+        if violations:
+            return preflight_failure(violations, build_seconds,
+                                     rejected_stats('benefit-share', model, build_seconds)), 200
+
+        # --- 5. SOLVE (preview: LP relaxation rounded to whole spots, see preview.py) ---
+        preview = request_mode(data) == 'preview'
+        approximation = None
+        if preview:
+            warm_start = None
+            solve_start = time.perf_counter()
+            solver, approximation = solve_preview(prob, x, presolved.model, solver_options(data))
+        else:
+            warm_start = apply_warm_start(prob, df_full, x, *warm_start_spots(data), presolved=presolved)
+            solver = make_solver(msg=True, timeLimit=time_limit, keepFiles=False, warmStart=started(warm_start),
+                                 **solver_options(data))
+            solve_start = time.perf_counter()
+            prob.solve(solver)
+        stats = solver_stats('benefit-share', prob, solver, build_seconds,
+                             time.perf_counter() - solve_start, time_limit, warm_start, presolve=presolved.stats)
+
+        status_str = LpStatus[prob.status]
+        values = presolved.expand([v.varValue for v in x])
+        has_solution = any((v is not None and v > 0) for v in values)
+
+        if status_str in ('Infeasible', 'Unbounded', 'Undefined') or not has_solution:
+            return {
+                "success": False,
+                "message": f"⚠️ No feasible solution found. Solver status: {status_str}",
+                "solver_status": status_str,
+                "cancelled": solver.cancelled,
+                "solver_stats": stats
+            }, 200
+
+        # --- 6. RESULT PROCESSING ---
+        df_full['Spots'] = [int(v) if v else 0 for v in values]
+        df_full['Total_Cost'] = df_full['Spots'] * df_full['NCost']
+        df_full['Total_Rating'] = df_full['Spots'] * df_full['NTVR']
+
+        # Filter only active spots
+        df_result = df_full[df_full['Spots'] > 0].copy()
+
+        # Rounding for cleanliness
+        numeric_cols = ['Cost', 'TVR', 'NCost', 'NTVR', 'Total_Cost', 'Total_Rating']
+        for c in numeric_cols:
+            if c in df_result.columns:
+                df_result[c] = df_result[c].astype(float).round(2)
+
+        # --- 7. COMMERCIALS SUMMARY (Enhanced) ---
+        commercials_summary = []
+        if 'Commercial' in df_result.columns:
+            for c in range(num_commercials):
+                df_c = df_result[df_result['Commercial'] == c].copy()
+                if df_c.empty:
+                    commercials_summary.append({
+                        "commercial_index": c,
+                        "total_cost": 0.0,
+                        "total_rating": 0.0,
+                        "cprp": 0.0,
+                        "channel_breakdown": {}
+                    })
+                    continue
+
+                # Overall commercial metrics
+                total_cost_c = float(df_c['Total_Cost'].sum())
+                total_rating_c = float(df_c['Total_Rating'].sum())
+                cprp_c = (total_cost_c / total_rating_c) if total_rating_c > 0 else 0.0
+
+                # Channel breakdown for this commercial
+                channel_breakdown = {}
+                for ch in df_c['Channel'].unique():
+                    df_ch = df_c[df_c['Channel'] == ch]
+                    channel_cost = float(df_ch['Total_Cost'].sum())
+                    channel_rating = float(df_ch['Total_Rating'].sum())
+                    channel_breakdown[ch] = {
+                        "cost": round(channel_cost, 2),
+                        "rating": round(channel_rating, 2),
+                        "percentage": round((channel_cost / total_cost_c * 100), 2) if total_cost_c > 0 else 0.0
+                    }
+
+                # Safe JSON conversion
+                details_safe = df_c.fillna(0).to_dict(orient='records')
+
+                commercials_summary.append({
+                    "commercial_index": c,
+                    "total_cost": round(total_cost_c, 2),
+                    "total_rating": round(total_rating_c, 2),
+                    "cprp": round(cprp_c, 2),
+                    "channel_breakdown": channel_breakdown,
+                    "details": details_safe
+                })
+
+        # --- 8. CHANNEL SUMMARY (Enhanced with commercial breakdown) ---
+        channel_summary = []
+        total_cost_all = float(df_result['Total_Cost'].sum())
+        total_rating_all = float(df_result['Total_Rating'].sum())
+
+        for ch in df_result['Channel'].unique():
+            df_ch = df_result[df_result['Channel'] == ch]
+
+            # Helper to get float sum safely
+            def get_sum(df_in, col):
+                return float(df_in[col].sum())
+
+            ch_cost = get_sum(df_ch, 'Total_Cost')
+            ch_rating = get_sum(df_ch, 'Total_Rating')
+
+            # Breakdown by Slot
+            def slot_sum(slot_name):
+                return get_sum(df_ch[df_ch['Slot'] == slot_name], 'Total_Cost')
+
+            a1 = slot_sum('A1')
+            a2 = slot_sum('A2')
+            a3 = slot_sum('A3')
+            a4 = slot_sum('A4')
+            a5 = slot_sum('A5')
+            b = slot_sum('B')
+
+            # Logic for Prime/NonPrime costs based on Channel type
+            if ch == 'HIRU TV':
+                prime_cost = a1 + a2 + a3 + a4 + a5
+                nonprime_cost = b
+            else:
+                prime_cost = get_sum(df_ch[df_ch['Slot'].isin(['A', 'A1', 'A2', 'A3', 'A4', 'A5', 'P'])], 'Total_Cost')
+                nonprime_cost = get_sum(df_ch[df_ch['Slot'] == 'B'], 'Total_Cost')
+
+            # Ratings Breakdown
+            prime_rating = get_sum(df_ch[df_ch['Slot'] != 'B'], 'Total_Rating')
+            nonprime_rating = get_sum(df_ch[df_ch['Slot'] == 'B'], 'Total_Rating')
+
+            # Commercial breakdown for this channel
+            commercial_breakdown = {}
+            if 'Commercial' in df_ch.columns:
+                for c in range(num_commercials):
+                    df_comm = df_ch[df_ch['Commercial'] == c]
+                    if not df_comm.empty:
+                        comm_cost = get_sum(df_comm, 'Total_Cost')
+                        comm_rating = get_sum(df_comm, 'Total_Rating')
+                        commercial_breakdown[f"Commercial_{c + 1}"] = {
+                            "cost": round(comm_cost, 2),
+                            "rating": round(comm_rating, 2),
+                            "percentage": round((comm_cost / ch_cost * 100), 2) if ch_cost > 0 else 0.0
+                        }
+
+            channel_summary.append({
+                'Channel': ch,
+                'Total_Cost': round(ch_cost, 2),
+                '% Cost': round((ch_cost / total_cost_all * 100), 2) if total_cost_all > 0 else 0,
+                'Total_Rating': round(ch_rating, 2),
+                '% Rating': round((ch_rating / total_rating_all * 100), 2) if total_rating_all > 0 else 0,
+                'Prime Cost': round(prime_cost, 2),
+                'Non-Prime Cost': round(nonprime_cost, 2),
+                'Prime Rating': round(prime_rating, 2),
+                'Non-Prime Rating': round(nonprime_rating, 2),
+                # Individual slots (useful for Hiru)
+                'A1 Cost': round(a1, 2),
+                'A2 Cost': round(a2, 2),
+                'A3 Cost': round(a3, 2),
+                'A4 Cost': round(a4, 2),
+                'A5 Cost': round(a5, 2),
+                'B Cost': round(b, 2),
+                # Commercial breakdown
+                'Commercial_Breakdown': commercial_breakdown
+            })
+
+        # --- 9. FINAL RESPONSE ---
+        df_result_safe = json.loads(df_result.to_json(orient="records"))
+
+        return {
+            "success": True,
+            "total_cost": float(round(total_cost_all, 2)),
+            "total_rating": float(round(total_rating_all, 2)),
+            "cprp": float(round(total_cost_all / total_rating_all, 2)) if total_rating_all > 0 else 0.0,
+            "channel_summary": channel_summary,
+            "commercials_summary": commercials_summary,
+            "df_result": df_result_safe,
+            "solver_status": str(status_str),
+            "cancelled": solver.cancelled,
+            "approximate": preview,
+            **({"approximation": approximation} if preview else {}),
+            "message": "Preview — approximate plan from the LP relaxation" if preview
+            else "Optimization stopped early — best plan found so far" if solver.cancelled
+            else "Optimization successful with channel-specific commercial splits",
+            "solver_stats": stats
+        }, 200
+
+    except Exception as e:
+        print(f"Error in optimize_by_benefit_share: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e)}, 500
+
+
+# === Bonus Channel Solves ===
+# Each channel's bonus MILP is independent, so channels are solved side by side
+# in a process pool. The pool lives for one request: bonus solves may already be
+# running inside a job worker, and a long-lived nested pool would keep it from exiting.
+BONUS_PARALLELISM = int(os.environ.get("BONUS_PARALLELISM", os.cpu_count() or 1))
+# Overall wall-clock budget for one bonus request, split across channels (0 = none)
+BONUS_DEADLINE_SECONDS = float(os.environ.get("BONUS_DEADLINE_SECONDS", 0))
+
+def bonus_parallelism(requested=None):
+    """Requested degree of parallelism, capped at BONUS_PARALLELISM."""
+    value = to_int_or_none(requested) or BONUS_PARALLELISM
+    return max(1, min(value, BONUS_PARALLELISM))
+
+
+def solve_bonus_channel(channel, df_ch, params, time_limit):
+    """Build and solve one channel's bonus MILP (runs in a pool worker)."""
+    build_start = time.perf_counter()
+    bonus_budget = params["bonus_budget"]
+
+    model = build_bonus_channel_model(channel, df_ch, params)
+    violations = preflight(model)
+    if violations:
+        build_seconds = time.perf_counter() - build_start
+        return {
+            "channel": channel,
+            "success": False,
+            "solver_status": "Infeasible",
+            "preflight": violations,
+            "timing": {"build_seconds": round(build_seconds, 3), "solve_seconds": 0.0,
+                       "time_limit": time_limit},
+            "solver_stats": rejected_stats('bonus', model, build_seconds)
+        }
+    presolved = presolve(model)
+    prob, x = presolved.model.to_pulp()
+
+    # solve
+    warm_start = apply_warm_start(prob, df_ch, x, *params.get("warm_start", (None, None)), presolved=presolved)
+    solve_start = time.perf_counter()
+    solver = make_solver(msg=True, timeLimit=time_limit, warmStart=started(warm_start),
+                         **params.get("solver_options", {}))
+    prob.solve(solver)
+    timing = {
+        "build_seconds": round(solve_start - build_start, 3),
+        "solve_seconds": round(time.perf_counter() - solve_start, 3),
+        "time_limit": time_limit,
+    }
+    stats = solver_stats('bonus', prob, solver, solve_start - build_start,
+                         time.perf_counter() - solve_start, time_limit, warm_start, presolve=presolved.stats)
+
+    if prob.status != 1:
+        return {
+            "channel": channel,
+            "success": False,
+            "solver_status": LpStatus[prob.status],
+            "cancelled": solver.cancelled,
+            "timing": timing,
+            "solver_stats": stats
+        }
+
+    df_ch['Spots'] = [int(v) if v else 0 for v in presolved.expand([v.varValue for v in x])]
+
+    # 🚨 BUSINESS infeasibility
+    if bonus_budget > 0 and df_ch['Spots'].sum() == 0:
+        return {
+            "channel": channel,
+            "success": False,
+            "solver_status": "Infeasible (No feasible allocation under constraints)",
+            "cancelled": solver.cancelled,
+            "timing": timing,
+            "solver_stats": stats
+        }
+
+    df_ch['Total_Cost'] = df_ch['Spots'] * df_ch['NCost']
+    df_ch['Total_NTVR'] = df_ch['Spots'] * df_ch['NTVR']
+    df_ch = df_ch[df_ch['Spots'] > 0]
+
+    # Convert numpy types to native Python types
+    total_cost_ch = float(df_ch['Total_Cost'].sum())
+    total_ntvr_ch = float(df_ch['Total_NTVR'].sum())
+    cprp_ch = float(total_cost_ch / total_ntvr_ch) if total_ntvr_ch else None
+
+    return {
+        "channel": channel,
+        "success": True,
+        "solver_status": LpStatus[prob.status],
+        "total_cost": round(total_cost_ch, 2),
+        "total_ntvr": round(total_ntvr_ch, 2),
+        "cprp": round(cprp_ch, 2) if cprp_ch else None,
+        "details": json.loads(df_ch.to_json(orient='records')),
+        "cancelled": solver.cancelled,
+        "timing": timing,
+        "solver_stats": stats
+    }
+
+
+def bonus_solver_stats(results, wall_seconds):
+    """
+    solver_stats for a bonus request: totals over the channel solves (each
+    already recorded on its own) plus the per-channel blocks.
+    """
+    channels = {r["channel"]: r["solver_stats"] for r in results if r.get("solver_stats")}
+    stats = list(channels.values())
+
+    def total(key):
+        values = [st[key] for st in stats if st.get(key) is not None]
+        return round(sum(values), 3) if values else None
+
+    gaps = [st["gap"] for st in stats if st.get("gap") is not None]
+    return {
+        "endpoint": "bonus",
+        "backend": stats[0].get("backend") if stats else None,
+        "build_seconds": total("build_seconds"),
+        "solve_seconds": round(wall_seconds, 3),
+        "variables": total("variables"),
+        "constraints": total("constraints"),
+        "nodes": total("nodes"),
+        "objective": total("objective"),
+        "best_bound": total("best_bound"),
+        "gap": max(gaps) if gaps else None,
+        "hit_time_limit": any(st.get("hit_time_limit") for st in stats),
+        "hit_gap_limit": any(st.get("hit_gap_limit") for st in stats),
+        "hit_stall_limit": any(st.get("hit_stall_limit") for st in stats),
+        "cancelled": any(r.get("cancelled") for r in results),
+        "channels": channels,
+    }
+
+
+def run_bonus_channels(tasks, parallelism, time_limit, deadline=0):
+    """
+    Solve [(channel, df_ch, params)] with at most `parallelism` channels at once.
+    With a deadline, each channel gets min(time_limit, its share of the time
+    left), counting the rounds of `parallelism` solves still to come
+    (including the ones already running).
+    Results are returned in task order regardless of finishing order.
+    Once the job is cancelled, channels that have not started are skipped.
+    """
+    start_ts = time.perf_counter()
+    results = [None] * len(tasks)
+
+    def allot(pending, in_flight=0):
+        if not deadline:
+            return time_limit
+        rounds = -(-(pending + in_flight) // parallelism)
+        remaining = deadline - (time.perf_counter() - start_ts)
+        return round(max(1.0, min(time_limit, remaining / rounds)), 1)
+
+    def skipped(channel):
+        return {"channel": channel, "success": False, "solver_status": "Cancelled", "cancelled": True}
+
+    if parallelism <= 1 or len(tasks) <= 1:
+        for pos, (channel, df_ch, params) in enumerate(tasks):
+            if cancel_requested():
+                results[pos] = skipped(channel)
+                continue
+            results[pos] = solve_bonus_channel(channel, df_ch, params, allot(len(tasks) - pos))
+        return results
+
+    monitor = solve_monitor.get()
+    with ProcessPoolExecutor(max_workers=min(parallelism, len(tasks))) as pool:
+        running = {}
+        next_pos = 0
+        while next_pos < len(tasks) or running:
+            while next_pos < len(tasks) and len(running) < parallelism:
+                channel, df_ch, params = tasks[next_pos]
+                if cancel_requested():
+                    results[next_pos] = skipped(channel)
+                    next_pos += 1
+                    continue
+                future = pool.submit(
+                    run_with_monitor, monitor, solve_bonus_channel,
+                    channel, df_ch, params, allot(len(tasks) - next_pos, len(running))
+                )
+                running[future] = next_pos
+                next_pos += 1
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pos = running.pop(future)
+                try:
+                    results[pos] = future.result()
+                except Exception as e:
+                    results[pos] = {
+                        "channel": tasks[pos][0],
+                        "success": False,
+                        "solver_status": f"Error: {e}"
+                    }
+    return results
+
+
+def bonus_tasks(data, df_full, warm_start=(None, None)):
+    """(channel, channel rows, params) of every channel's bonus MILP, in channel order."""
+    # Map frontend → backend names
+    bonus_budgets = data.get('bonus_budgets') or data.get('bonusBudgetsByChannel')
+    channel_bounds = data.get('channel_bounds') or data.get('channelAllowPctByChannel')
+    commercial_budgets = data.get('commercial_budgets') or data.get('commercialTargetsByChannel')
+
+    min_spots = data.get('min_spots', 0)
+    max_spots = data.get('max_spots') or data.get('maxSpots', 20)
+
+    channel_max_spots = data.get("channel_max_spots") or {}
+
+    channel_weekend_max_spots = data.get("channel_weekend_max_spots") or {}
+
+    tasks = []
+    for channel in df_full['Channel'].unique():
+        tasks.append((channel, df_full[df_full['Channel'] == channel].copy(), {
+            "bonus_budget": bonus_budgets.get(channel, 0),
+            "budget_bound": channel_bounds.get(channel, 0),
+            "comm_budgets": commercial_budgets.get(channel, {}),
+            "min_spots": min_spots,
+            "max_spots": max_spots,
+            "ch_cap": channel_max_spots.get(channel, max_spots),
+            "we_cap": channel_weekend_max_spots.get(channel),
+            "solver_options": solver_options(data),
+            "warm_start": warm_start,
+        }))
+    return tasks
+
+
+def solve_bonus(data):
+
+    df_full = request_frame(data, 'df_full', 'programRows')
+    if df_full is None:
+        return FRAME_EXPIRED, 410
+
+    # NEW: Add channel commercial percentages
+    channel_commercial_pct_map = data.get('channel_commercial_pct_map') or {}
+    budget_proportions = data.get('budget_proportions') or []
+    num_commercials = data.get('num_commercials', 1)
+
+    time_limit = data.get('time_limit') or data.get('timeLimitSec', 120)
+
+    if df_full.empty:
+        return {"success": False, "message": "⚠️ df_full/programRows is empty"}, 400
+
+    # 🔍 REQUIRED COLUMNS VALIDATION (ADD HERE)
+    required_cols = {'NCost', 'NTVR', 'Channel', 'Commercial', 'IsWeekend'}
+    missing = required_cols - set(df_full.columns)
+    if missing:
+        return {
+            "success": False,
+            "message": f"Missing columns: {sorted(missing)}"
+        }, 400
+
+    # One independent MILP per channel, solved in parallel; results keep channel order
+    parallelism = bonus_parallelism(data.get('parallelism'))
+    time_limit = float(time_limit)
+    deadline = float(data.get('deadline_seconds') or BONUS_DEADLINE_SECONDS or 0)
+    tasks = bonus_tasks(data, df_full, warm_start_spots(data))   # warm start looked up once, applied per channel
+
+    start_ts = time.perf_counter()
+    results = run_bonus_channels(tasks, parallelism, time_limit, deadline)
+    wall_seconds = time.perf_counter() - start_ts
+
+    return {
+        "success": True,
+        "solver_status": "Optimal",
+        "cancelled": any(r.get("cancelled") for r in results),
+        "totals": {
+            "bonus_total_cost": sum(r["total_cost"] for r in results if r["success"]),
+            "bonus_total_rating": sum(r["total_ntvr"] for r in results if r["success"]),
+        },
+        "tables": {
+            "by_channel": [
+                {
+                    "Channel": r["channel"],
+                    "Slot": "B",
+                    "Spots": sum(d["Spots"] for d in r.get("details", [])),
+                    "Total_Cost": r.get("total_cost", 0),
+                    "Total_Rating": r.get("total_ntvr", 0),
+                    "solver_status": r.get("solver_status"),
+                    "success": r.get("success", False),
+                    "cancelled": r.get("cancelled", False),
+                    "timing": r.get("timing")
+                }
+                for r in results
+            ],
+            "by_program": [
+                {
+                    **d,
+                    "Channel": r["channel"],
+                    "Slot": "B"
+                }
+                for r in results if r["success"]
+                for d in r["details"]
+            ]
+        },
+        "timing": {
+            "wall_seconds": round(wall_seconds, 3),
+            "parallelism": parallelism,
+            "deadline_seconds": deadline or None,
+        },
+        "solver_stats": bonus_solver_stats(results, wall_seconds)
+    }, 200
+
+
+# === Budget Sweep ===
+# One budget-share model solved at a range of total budgets (a rating-vs-budget
+# frontier). Every budget-dependent right-hand side is affine in the total
+# budget, so the model is built once per worker and only its row bounds move
+# between points. Budgets are split into contiguous segments, one per worker;
+# within a segment each point starts from its neighbour's solution.
+SWEEP_PARALLELISM = int(os.environ.get("SWEEP_PARALLELISM", os.cpu_count() or 1))
+SWEEP_MAX_POINTS = int(os.environ.get("SWEEP_MAX_POINTS", 41))
+SWEEP_DEFAULT_PCTS = list(range(-30, 31, 5))
+
+
+def sweep_budgets(data, base_budget):
+    """
+    The sweep's total budgets, ascending: explicit "budgets", else "budget_pcts"
+    (% change from "budget"), else -30% .. +30% in 5% steps.
+    """
+    budgets = [to_float_or_none(b) for b in (data.get('budgets') or [])]
+    if not budgets:
+        pcts = [to_float_or_none(p) for p in (data.get('budget_pcts') or SWEEP_DEFAULT_PCTS)]
+        budgets = [base_budget * (1 + p / 100.0) for p in pcts if p is not None]
+    return sorted({round(b, 2) for b in budgets if b is not None and b > 0})[:SWEEP_MAX_POINTS]
+
+
+def budget_rhs(df, params):
+    """
+    (intercept, slope) with row_rhs(B) = intercept + B * slope for the
+    budget-share model at total budget B (rows in build order).
+    """
+    at_zero = np.array(build_budget_share_model(df, dict(params, total_budget=0.0)).row_rhs)
+    at_one = np.array(build_budget_share_model(df, dict(params, total_budget=1.0)).row_rhs)
+    return at_zero, at_one - at_zero
+
+
+def sweep_pct(budget, base_budget):
+    return round((budget / base_budget - 1) * 100, 2) + 0.0 if base_budget else None   # no -0.0
+
+
+def sweep_point_summary(df, spots, budget, base_budget):
+    """Total rating, CPRP and channel split of one sweep point's allocation."""
+    cost = spots * df['NCost'].to_numpy(dtype=float)
+    rating = spots * df['NTVR'].to_numpy(dtype=float)
+    total_cost, total_rating = float(cost.sum()), float(rating.sum())
+    by_channel = pd.DataFrame({'Channel': df['Channel'].to_numpy(), 'Spots': spots,
+                               'Total_Cost': cost, 'Total_Rating': rating})
+    by_channel = by_channel[by_channel['Spots'] > 0].groupby('Channel', sort=False).sum()
+    return {
+        "budget": round(budget, 2),
+        "budget_pct": sweep_pct(budget, base_budget),
+        "total_cost": round(total_cost, 2),
+        "total_rating": round(total_rating, 2),
+        "cprp": round(total_cost / total_rating, 2) if total_rating else None,
+        "spots": int(spots.sum()),
+        "channel_split": [
+            {
+                "Channel": ch,
+                "Spots": int(row['Spots']),
+                "Total_Cost": round(float(row['Total_Cost']), 2),
+                "% Cost": round(float(row['Total_Cost']) / total_cost * 100, 2) if total_cost else 0,
+                "Total_Rating": round(float(row['Total_Rating']), 2),
+                "% Rating": round(float(row['Total_Rating']) / total_rating * 100, 2) if total_rating else 0,
+            }
+            for ch, row in by_channel.iterrows()
+        ],
+    }
+
+
+def solve_sweep_segment(df, params, budgets, rhs, options, base_budget):
+    """
+    Solve consecutive sweep budgets on one model (runs in a pool worker):
+    build once, then per point move the row bounds, warm-start from the
+    previous point's solution and solve.
+    """
+    build_start = time.perf_counter()
+    model = build_budget_share_model(df, params)
+    intercept, slope = rhs
+    # Rows whose rhs moves with the budget stay rows (not bounds)
+    presolved = presolve(model, keep_rows=slope != 0)
+    prob, x = presolved.model.to_pulp()
+    constraints = list(prob.constraints.values())
+    build_seconds = time.perf_counter() - build_start
+
+    def failed(budget, status, **fields):
+        return {"budget": round(budget, 2), "budget_pct": sweep_pct(budget, base_budget),
+                "success": False, "solver_status": status, **fields}
+
+    points = []
+    neighbour = False   # x holds the previous point's solution
+    for budget in budgets:
+        if cancel_requested():
+            points.append(failed(budget, "Cancelled", cancelled=True))
+            continue
+        model.row_rhs = (intercept + budget * slope).tolist()
+        for constraint, value in zip(constraints, presolved.move_rhs(model.row_rhs)):
+            constraint.changeRHS(value)
+        violations = preflight(model)
+        if violations:
+            points.append(failed(budget, "Infeasible", preflight=violations[:5]))
+            continue
+
+        warm_start = None
+        if neighbour:
+            violated, freed = repair_start(prob, x)
+            warm_start = {"source": "neighbour", "violated_rows": violated, "freed": freed}
+        solver = make_solver(msg=False, timeLimit=params['time_limit'], warmStart=warm_start is not None, **options)
+        solve_start = time.perf_counter()
+        prob.solve(solver)
+        stats = solver_stats('budget-sweep', prob, solver, build_seconds,
+                             time.perf_counter() - solve_start, params['time_limit'], warm_start,
+                             presolve=presolved.stats)
+        build_seconds = 0.0   # only the first point pays for the build
+
+        spots = np.array([int(v) if v else 0 for v in presolved.expand([v.varValue for v in x])], dtype=float)
+        if prob.status != 1 or not spots.any():
+            points.append(failed(budget, LpStatus[prob.status], cancelled=solver.cancelled, solver_stats=stats))
+            continue
+        neighbour = True
+        points.append({
+            **sweep_point_summary(df, spots, budget, base_budget),
+            "success": True,
+            "solver_status": LpStatus[prob.status],
+            "is_optimal": stats["stop_reason"] == 'optimal',
+            "cancelled": solver.cancelled,
+            "solver_stats": stats,
+        })
+    return points
+
+
+def sweep_solver_stats(points, build_seconds, wall_seconds):
+    """solver_stats for a sweep: totals over the point solves plus each point's block."""
+    stats = [p["solver_stats"] for p in points if p.get("solver_stats")]
+    gaps = [st["gap"] for st in stats if st.get("gap") is not None]
+    return {
+        "endpoint": "budget-sweep",
+        "backend": stats[0].get("backend") if stats else None,
+        "build_seconds": round(build_seconds, 3),
+        "solve_seconds": round(wall_seconds, 3),
+        "points_solved": len(stats),
+        "warm_started": sum(1 for st in stats if st.get("warm_start")),
+        "nodes": sum(st.get("nodes") or 0 for st in stats),
+        "gap": max(gaps) if gaps else None,
+        "hit_time_limit": any(st.get("hit_time_limit") for st in stats),
+        "cancelled": any(p.get("cancelled") for p in points),
+        "points": stats,
+    }
+
+
+def solve_budget_sweep(data):
+    df_full = request_frame(data)
+    if df_full is None:
+        return FRAME_EXPIRED, 410
+    params = parse_budget_share_params(data)
+    if df_full.empty or not params['budget_shares']:
+        return {"error": "Missing data"}, 400
+    required_cols = {'NCost', 'NTVR', 'Channel', 'Slot', 'IsWeekend'}
+    missing = required_cols - set(df_full.columns)
+    if missing:
+        return {"error": f"Missing columns in df_full: {sorted(missing)}"}, 400
+
+    base_budget = params['total_budget']
+    budgets = sweep_budgets(data, base_budget)
+    if not budgets:
+        return {"error": "No budgets to sweep (send budget with budget_pcts, or budgets)"}, 400
+
+    start_ts = time.perf_counter()
+    rhs = budget_rhs(df_full, params)
+    build_seconds = time.perf_counter() - start_ts
+    options = solver_options(data)
+    parallelism = max(1, min(to_int_or_none(data.get('parallelism')) or SWEEP_PARALLELISM,
+                             SWEEP_PARALLELISM, len(budgets)))
+    segments = [list(s) for s in np.array_split(np.array(budgets), parallelism)]
+    args = [(df_full, params, segment, rhs, options, base_budget) for segment in segments]
+
+    if parallelism == 1:
+        points = solve_sweep_segment(*args[0])
+    else:
+        monitor = solve_monitor.get()
+        with ProcessPoolExecutor(max_workers=parallelism) as pool:
+            futures = [pool.submit(run_with_monitor, monitor, solve_sweep_segment, *a) for a in args]
+            points = []
+            for segment, future in zip(segments, futures):
+                try:
+                    points.extend(future.result())
+                except Exception as e:
+                    points.extend({"budget": round(b, 2), "budget_pct": sweep_pct(b, base_budget),
+                                   "success": False, "solver_status": f"Error: {e}"} for b in segment)
+    wall_seconds = time.perf_counter() - start_ts
+
+    return {
+        "success": any(p["success"] for p in points),
+        "base_budget": base_budget,
+        "points": points,
+        "cancelled": any(p.get("cancelled") for p in points),
+        "timing": {
+            "wall_seconds": round(wall_seconds, 3),
+            "parallelism": parallelism,
+            "segments": [len(s) for s in segments],
+        },
+        "solver_stats": sweep_solver_stats(points, build_seconds, wall_seconds),
+    }, 200
+
+
+# === Model Diagnostics ===
+# Builds a request's models without solving them and reports their
+# coefficient ranges as built, after presolve and after scaling.
+DIAGNOSTIC_ENDPOINTS = ('plan', 'budget-share', 'benefit-share', 'bonus', 'budget-sweep')
+
+
+def request_models(kind, data, df_full):
+    """(label, SparseModel) of every model the `kind` endpoint builds for the request."""
+    if kind == 'plan':
+        return [('plan', build_plan_model(df_full, parse_plan_params(data)))]
+    if kind == 'benefit-share':
+        channels = list((data.get('budget_shares') or {}).keys())
+        df = benefit_share_frame(df_full, channels)
+        return [(kind, build_benefit_share_model(df, parse_benefit_share_params(data, channels)))]
+    if kind == 'bonus':
+        return [(f'bonus:{channel}', build_bonus_channel_model(channel, df_ch, params))
+                for channel, df_ch, params in bonus_tasks(data, df_full)]
+    # A sweep solves the budget-share model at every point
+    return [(kind, build_budget_share_model(df_full, parse_budget_share_params(data)))]
+
+
+def model_diagnostics(data):
+    """
+    Coefficient ranges of the models `endpoint` (default budget-share) would
+    solve for this payload; see coefficient_ranges.
+    """
+    kind = str(data.get('endpoint') or 'budget-share').strip().lower()
+    if kind not in DIAGNOSTIC_ENDPOINTS:
+        return {"error": f"endpoint must be one of {', '.join(DIAGNOSTIC_ENDPOINTS)}"}, 400
+    df_full = request_frame(data, 'df_full', 'programRows')
+    if df_full is None:
+        return FRAME_EXPIRED, 410
+    if df_full.empty:
+        return {"error": "df_full is empty"}, 400
+    try:
+        models = request_models(kind, data, df_full)
+    except (KeyError, ValueError, TypeError) as e:
+        return {"error": f"Could not build the {kind} model: {e}"}, 400
+
+    reports = []
+    for label, model in models:
+        reduced = reduce_model(model)
+        scaled, _ = scale_model(reduced.model)
+        reports.append({
+            "model": label,
+            "variables": model.n_vars,
+            "constraints": model.n_rows,
+            "preflight": preflight(model)[:5],
+            "objective_scale": scaled.obj_scale,
+            "ranges": {
+                "built": coefficient_ranges(model),
+                "presolved": coefficient_ranges(reduced.model),
+                "scaled": coefficient_ranges(scaled),
+            },
+        })
+    return {"success": True, "endpoint": kind, "scaling_enabled": SCALING_ENABLED, "models": reports}, 200
+
+
+OPTIMIZERS = {
+    'plan': solve_plan,
+    'budget-share': solve_budget_share,
+    'benefit-share': solve_benefit_share,
+    'bonus': solve_bonus,
+    'budget-sweep': solve_budget_sweep,
+}
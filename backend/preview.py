@@ -0,0 +1,147 @@
+import os
+import time
+
+import numpy as np
+from pulp import LpStatus
+
+from solver import make_solver
+
+# === Preview Mode ===
+# "mode": "preview" (or ?mode=preview) on budget-share / benefit-share answers
+# slider moves interactively instead of running branch-and-bound. The LP
+# relaxation of the presolved model is solved, and its spots become whole
+# numbers:
+#   1. every variable is floored, then rounded up (largest fractional part
+#      first) wherever no upper band (<= row) would be exceeded;
+#   2. lower bands (>= rows) still short get more spots, the best objective
+#      per unit of the row first, again without exceeding any upper band.
+# A band that cannot be repaired this way is listed in the summary. The plan
+# is feasible for every upper band but is not optimal: responses carry
+# "approximate": true.
+MODES = ('solve', 'preview')
+# The relaxation normally solves in milliseconds; this only guards the response time
+PREVIEW_TIME_LIMIT_SECONDS = float(os.environ.get("PREVIEW_TIME_LIMIT_SECONDS", 5))
+
+
+def request_mode(data):
+    value = str(data.get('mode') or '').strip().lower()
+    return value if value in MODES else 'solve'
+
+
+class _Rows:
+    """Row activities of a SparseModel at spots v, with the column view needed to move them."""
+
+    def __init__(self, model, v, tol):
+        indptr, indices, data = model.to_csr()
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.rhs = np.array(model.row_rhs, dtype=float)
+        sense = np.array(model.row_sense)
+        self.upper = np.isin(sense, ['<=', '=='])
+        self.lower = np.isin(sense, ['>=', '=='])
+        self.slack = tol * np.maximum(1.0, np.abs(self.rhs))
+        row_of = np.repeat(np.arange(model.n_rows), np.diff(indptr))
+        self.activity = np.bincount(row_of, weights=data * v[indices], minlength=model.n_rows)
+        order = np.argsort(indices, kind='stable')
+        self.col_ptr = np.zeros(model.n_vars + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=model.n_vars), out=self.col_ptr[1:])
+        self.col_rows, self.col_coef = row_of[order], data[order]
+
+    def room(self, j):
+        """How many spots column j can gain before an upper band is exceeded or a lower band gets worse."""
+        rows = self.col_rows[self.col_ptr[j]:self.col_ptr[j + 1]]
+        coef = self.col_coef[self.col_ptr[j]:self.col_ptr[j + 1]]
+        room = np.inf
+        caps = self.upper[rows] & (coef > 0)
+        if caps.any():
+            left = self.rhs[rows[caps]] + self.slack[rows[caps]] - self.activity[rows[caps]]
+            room = min(room, np.floor(left / coef[caps]).min())
+        floors = self.lower[rows] & (coef < 0)
+        if floors.any():
+            left = self.activity[rows[floors]] - (self.rhs[rows[floors]] - self.slack[rows[floors]])
+            room = min(room, np.floor(np.maximum(left, 0) / -coef[floors]).min())
+        return max(room, 0)
+
+    def add(self, j, count):
+        rows = self.col_rows[self.col_ptr[j]:self.col_ptr[j + 1]]
+        np.add.at(self.activity, rows, count * self.col_coef[self.col_ptr[j]:self.col_ptr[j + 1]])
+
+    def short(self):
+        return np.flatnonzero(self.lower & (self.activity < self.rhs - self.slack))
+
+
+def round_and_repair(model, relaxed, tol=1e-6):
+    """
+    Whole spots for `model` from its relaxation's values (see above).
+    Returns (spots, rounded up, spots added by the repair, rows still short).
+    """
+    lb, ub = model.lb, model.ub
+    v = np.clip(np.floor(relaxed + tol), lb, ub)
+    rows = _Rows(model, v, tol)
+
+    rounded_up = 0
+    fraction = relaxed - v
+    for j in np.argsort(-fraction, kind='stable').tolist():
+        if fraction[j] <= tol:
+            break
+        if v[j] < ub[j] and rows.room(j) >= 1:
+            v[j] += 1
+            rows.add(j, 1)
+            rounded_up += 1
+
+    added = 0
+    stuck = set()
+    short = [r for r in rows.short().tolist() if r not in stuck]
+    while short:
+        r = short[0]
+        idx = rows.indices[rows.indptr[r]:rows.indptr[r + 1]]
+        coef = rows.data[rows.indptr[r]:rows.indptr[r + 1]]
+        # Best objective per unit of this row's activity first
+        gained = False
+        for k in np.argsort(-model.obj[idx] / np.where(coef > 0, coef, np.inf), kind='stable').tolist():
+            j, a = int(idx[k]), coef[k]
+            if a <= 0 or v[j] >= ub[j]:
+                continue
+            needed = np.ceil((rows.rhs[r] - rows.slack[r] - rows.activity[r]) / a)
+            count = min(needed, ub[j] - v[j], rows.room(j))
+            if count >= 1:
+                v[j] += count
+                rows.add(j, count)
+                added += int(count)
+                gained = True
+                break
+        if not gained:
+            stuck.add(r)
+        short = [r for r in rows.short().tolist() if r not in stuck]
+    return v, rounded_up, added, sorted(stuck)
+
+
+def solve_preview(prob, x, model, options):
+    """
+    Solve prob's LP relaxation and leave the rounded, repaired spots in x
+    (the columns of `model`, the presolved SparseModel prob was emitted from).
+    Returns (solver, approximation summary).
+    """
+    start_ts = time.perf_counter()
+    solver = make_solver(backend=options.get('backend'), mip=False, msg=False, timeLimit=PREVIEW_TIME_LIMIT_SECONDS)
+    prob.solve(solver)
+    summary = {"method": "lp_rounding", "relaxation_status": LpStatus[prob.status]}
+    if prob.status != 1:
+        return solver, dict(summary, seconds=round(time.perf_counter() - start_ts, 3))
+
+    relaxed = np.array([v.varValue or 0.0 for v in x])
+    spots, rounded_up, added, short = round_and_repair(model, relaxed)
+    for var, value in zip(x, spots.tolist()):
+        var.varValue = value
+    bound = float(model.obj @ relaxed) / model.obj_scale
+    objective = float(model.obj @ spots) / model.obj_scale
+    return solver, dict(
+        summary,
+        relaxation_bound=round(bound, 4),
+        objective=round(objective, 4),
+        gap=round(max(0.0, bound - objective) / max(abs(bound), 1e-9), 6),
+        rounded_up=rounded_up,
+        repaired_spots=added,
+        bands_met=not short,
+        short_bands=[model.row_group[r] for r in short][:10],
+        seconds=round(time.perf_counter() - start_ts, 3),
+    )
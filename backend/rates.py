@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# === Rate Rules ===
+# Applied in order after manual overrides; the first matching rule sets the rate.
+#   client        -> rule only applies when the selected client matches
+#   channels      -> channels the rule covers (exact match)
+#   rate_column   -> df column holding the rate
+#   fallback      -> column used when rate_column is null (None = rule skipped, fall through)
+RATE_RULES = [
+    {
+        "name": "cargills_derana",
+        "client": "Cargills",
+        "channels": {"DERANA TV"},
+        "rate_column": "CargillsRate",
+        "fallback": None,
+    },
+    {
+        "name": "net_cost_channels",
+        "client": None,
+        "channels": {"SHAKTHI TV", "SHAKTHI NEWS", "SIRASA TV", "SIRASA NEWS"},
+        "rate_column": "NetCost",
+        "fallback": "Cost",
+    },
+]
+# Everything else: Cost less the channel discount (pct), default when the client sends none
+DEFAULT_DISCOUNT_PCT = 30.0
+
+
+def compile_rate_rules(selected_client, rules=RATE_RULES):
+    """Rules that apply to this client, as (channels, rate_column, fallback) tuples."""
+    return [
+        (list(rule["channels"]), rule["rate_column"], rule["fallback"])
+        for rule in rules
+        if rule["client"] is None or rule["client"] == selected_client
+    ]
+
+
+def round_cents(values):
+    """
+    Python round(v, 2) over an array. np.round matches it except when v*100
+    lands on a .5 tie through float error, so only those are redone one by one.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.round(values, 2)
+    scaled = values * 100.0
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        out[i] = round(float(values[i]), 2)
+    return out
+
+
+def compute_negotiated_rates(df, negotiated_rates=None, channel_discounts=None,
+                             selected_client="Other", manual_override=None):
+    """
+    Negotiated_Rate for every row of df (needs Id, Channel, Cost, NetCost, CargillsRate).
+    Precedence: manual override -> RATE_RULES in order -> channel discount.
+    """
+    negotiated_rates = negotiated_rates or {}
+    channel_discounts = channel_discounts or {}
+    manual_override = manual_override or {}
+
+    channel = df['Channel']
+    cost = df['Cost'].to_numpy(dtype=float)
+    rate = np.full(len(df), np.nan)
+    assigned = np.zeros(len(df), dtype=bool)
+
+    # 1) Manual overrides: frontend value wins when flagged and present.
+    #    Keys are str(Id); matching on ints avoids stringifying the whole column.
+    #    Only overrides of programs in df are converted to float; the rest are never read.
+    overrides = {
+        int(pid): negotiated_rates[pid]
+        for pid, flag in manual_override.items()
+        if flag and negotiated_rates.get(pid) is not None and str(pid).isdigit() and str(int(pid)) == pid
+    }
+    if overrides:
+        ids = df['Id'].to_numpy(dtype=np.int64)
+        keys = np.fromiter(overrides.keys(), dtype=np.int64, count=len(overrides))
+        order = np.argsort(keys)
+        keys = keys[order]
+        pos = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+        mask = keys[pos] == ids
+        raw = list(overrides.values())
+        values = np.full(len(keys), np.nan)
+        for i in np.unique(pos[mask]).tolist():
+            values[i] = float(raw[order[i]])
+        rate[mask] = values[pos[mask]]
+        assigned |= mask
+
+    # 2) Table rules (client rates, net-cost channels)
+    for channels, rate_column, fallback in compile_rate_rules(selected_client):
+        on_channel = ~assigned & channel.isin(channels).to_numpy()
+        if not on_channel.any():
+            continue
+        values = df[rate_column].to_numpy(dtype=float)
+        has_value = on_channel & ~np.isnan(values)
+        rate[has_value] = values[has_value]
+        assigned |= has_value
+        if fallback is not None:
+            use_fallback = on_channel & ~has_value
+            rate[use_fallback] = df[fallback].to_numpy(dtype=float)[use_fallback]
+            assigned |= use_fallback
+
+    # 3) Normal channels: apply the channel discount
+    rest = ~assigned
+    if rest.any():
+        # Only the discounts of channels priced here are converted; None means the default
+        discounts = {
+            ch: float(channel_discounts[ch])
+            for ch in pd.unique(channel.to_numpy()[rest])
+            if channel_discounts.get(ch) is not None
+        }
+        disc_pct = channel.map(discounts).fillna(DEFAULT_DISCOUNT_PCT).to_numpy(dtype=float)
+        rate[rest] = round_cents(cost[rest] * (1.0 - disc_pct[rest] / 100.0))
+
+    return rate
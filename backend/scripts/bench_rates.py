@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rates import compute_negotiated_rates  # noqa: E402
+
+# === Equivalence Check / Benchmark ===
+# python scripts/bench_rates.py  -> compares against the former row-wise effective_cost at 10k/100k/1M rows
+
+def _legacy_negotiated_rates(df, negotiated_rates, channel_discounts, selected_client, manual_override):
+    special_channels = {"SHAKTHI TV", "SHAKTHI NEWS", "SIRASA TV", "SIRASA NEWS"}
+
+    def effective_cost(row):
+        str_pid = str(row['Id'])
+        ch = row['Channel']
+        base_cost = float(row['Cost'])
+        if manual_override.get(str_pid):
+            val = negotiated_rates.get(str_pid)
+            if val is not None:
+                return float(val)
+        if selected_client == "Cargills" and ch == "DERANA TV" and pd.notna(row['CargillsRate']):
+            return float(row['CargillsRate'])
+        if ch in special_channels:
+            if pd.notna(row['NetCost']):
+                return float(row['NetCost'])
+            return base_cost
+        disc_pct = float(channel_discounts.get(ch, 30.0))
+        return round(base_cost * (1.0 - disc_pct / 100.0), 2)
+
+    return df.apply(effective_cost, axis=1).to_numpy(dtype=float)
+
+
+def _sample_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    channels = np.array(["DERANA TV", "SIRASA TV", "SHAKTHI NEWS", "HIRU TV", "ITN", "SWARNAVAHINI"])
+    df = pd.DataFrame({
+        'Id': np.arange(1, n + 1),
+        'Channel': channels[rng.integers(0, len(channels), n)],
+        'Cost': rng.integers(1, 400, n) * 250.0 + rng.integers(0, 100, n) / 100.0,
+    })
+    df['NetCost'] = np.where(rng.random(n) < 0.7, df['Cost'] * 0.8, np.nan)
+    df['CargillsRate'] = np.where(rng.random(n) < 0.6, df['Cost'] * 0.6, np.nan)
+    ids = rng.choice(n, size=max(1, n // 100), replace=False) + 1
+    rates = {str(i): float(rng.integers(1000, 90000)) for i in ids}
+    override = {str(i): bool(i % 2) for i in ids}
+    discounts = {"HIRU TV": 12.5, "ITN": "25"}
+    return df, rates, discounts, override
+
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000)):
+    for n in sizes:
+        df, rates, discounts, override = _sample_frame(n)
+        for client in ("Cargills", "Other"):
+            t0 = time.perf_counter()
+            new = compute_negotiated_rates(df, rates, discounts, client, override)
+            t_new = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            old = _legacy_negotiated_rates(df, rates, discounts, client, override)
+            t_old = time.perf_counter() - t0
+            identical = np.array_equal(new, old)
+            print(f"{n:>9} rows  client={client:<8}  row-apply {t_old:8.3f}s  "
+                  f"vectorized {t_new:7.4f}s  x{t_old / t_new:7.1f}  identical={identical}")
+            if not identical:
+                raise AssertionError(f"compute_negotiated_rates differs from effective_cost at {n} rows")
+
+
+if __name__ == "__main__":
+    benchmark()
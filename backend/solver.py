@@ -0,0 +1,618 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import traceback
+import subprocess
+from contextvars import ContextVar
+
+from pulp import PULP_CBC_CMD, LpMaximize, LpStatus, LpStatusNotSolved, LpSolutionNoSolutionFound
+from pulp.apis.core import PulpSolverError
+
+from solver_threads import solver_threads
+
+# === Progress Monitor ===
+# Whoever owns a request (e.g. a job worker) installs a monitor here; every
+# solve (CBC or HiGHS) started in that context reports to monitor.on_progress(event), and is
+# interrupted once monitor.should_cancel() (optional) returns True.
+solve_monitor = ContextVar('solve_monitor', default=None)
+
+# Seconds between cancellation / stall checks while a solver runs
+SOLVER_CANCEL_POLL_SECONDS = float(os.environ.get("SOLVER_CANCEL_POLL_SECONDS", 0.5))
+# Seconds CBC gets to stop and write its incumbent after a cancel before it is killed
+SOLVER_CANCEL_GRACE_SECONDS = float(os.environ.get("SOLVER_CANCEL_GRACE_SECONDS", 10))
+
+
+def _default_workspace_root():
+    # tmpfs when the host has one: model/solution files never touch the disk
+    shm = "/dev/shm"
+    return shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+
+
+# Each solve writes its MPS/solution files to its own directory under here (None = system temp dir)
+SOLVER_TMP_DIR = os.environ.get("SOLVER_TMP_DIR") or _default_workspace_root()
+# Solver used when a request does not name one: cbc | highs (highs needs highspy)
+SOLVER_BACKEND = os.environ.get("SOLVER_BACKEND", "cbc").strip().lower()
+SOLVER_BACKENDS = ('cbc', 'highs')
+# Every solve's solver_stats is appended here as one JSON line ("" = don't record)
+SOLVER_STATS_PATH = os.environ.get(
+    "SOLVER_STATS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver_stats.jsonl")
+)
+
+
+def run_with_monitor(monitor, fn, *args):
+    """Call fn(*args) with `monitor` installed (carries it into pool workers)."""
+    token = solve_monitor.set(monitor)
+    try:
+        return fn(*args)
+    finally:
+        solve_monitor.reset(token)
+
+
+# === CBC Log Parsing ===
+# CBC is run with -max for maximisation, so objective values in its Cbc00xx
+# lines are negated; SolveProgress flips them back to the model's own sense.
+# Solvers see the objective times the problem's objective_scale (see
+# optimization's Scaling); every value reported from here is divided back.
+_NUM = r'(-?\d+(?:\.\d*)?(?:e[+-]?\d+)?)'
+INCUMBENT_RE = re.compile(
+    rf'^Cbc00(?:04|12)I Integer solution of {_NUM} found.*? after \d+ iterations and (\d+) nodes'
+)
+NODES_RE = re.compile(
+    rf'^Cbc0010I After (\d+) nodes, \d+ on tree, {_NUM} best solution, best possible {_NUM}'
+)
+ROOT_RE = re.compile(rf'^Cbc0013I At root node, .* to {_NUM} in')
+SEARCH_END_RE = re.compile(
+    rf'^Cbc000[15]I .* - best objective {_NUM}(?:,| \(best possible {_NUM}\),) took \d+ iterations and (\d+) nodes'
+)
+NO_SOLUTION = 1e49   # CBC prints 1e+50 as "best solution" before it has one
+
+
+class SolveProgress:
+    """
+    Incumbent / best bound / gap of a running solve: parsed line by line from
+    CBC's log (feed), or pushed by an in-process solver's callbacks (update).
+    """
+
+    def __init__(self, name, sense, scale=1.0):
+        self.name = name
+        self.sign = -1.0 if sense == LpMaximize else 1.0
+        self.scale = scale
+        self.started = time.time()
+        self.incumbent = None
+        self.improved_at = None     # when the incumbent last changed
+        self.best_bound = None
+        self.nodes = 0
+
+    def _value(self, text):
+        value = float(text)
+        return None if abs(value) >= NO_SOLUTION else self.sign * value / self.scale
+
+    def _set_incumbent(self, text):
+        value = self._value(text)
+        if value is not None and value != self.incumbent:
+            self.improved_at = time.time()
+        self.incumbent = value
+
+    def feed(self, line):
+        """Update from one log line; returns an event dict when something changed."""
+        m = INCUMBENT_RE.match(line)
+        if m:
+            self._set_incumbent(m.group(1))
+            self.nodes = int(m.group(2))
+            return self.event('incumbent')
+        m = NODES_RE.match(line)
+        if m:
+            self.nodes = int(m.group(1))
+            self._set_incumbent(m.group(2))
+            self.best_bound = self._value(m.group(3))
+            return self.event('nodes')
+        m = ROOT_RE.match(line)
+        if m:
+            self.best_bound = self._value(m.group(1))
+            return self.event('root')
+        m = SEARCH_END_RE.match(line)
+        if m:
+            self._set_incumbent(m.group(1))
+            if m.group(2) is not None:
+                self.best_bound = self._value(m.group(2))
+            self.nodes = int(m.group(3))
+            return self.event('search_end')
+        return None
+
+    def update(self, kind, incumbent, best_bound, nodes):
+        """Set the state from values already in the model's sense; returns the event."""
+        if incumbent is not None:
+            incumbent /= self.scale
+        if best_bound is not None:
+            best_bound /= self.scale
+        if incumbent is not None and incumbent != self.incumbent:
+            self.improved_at = time.time()
+            self.incumbent = incumbent
+        if best_bound is not None:
+            self.best_bound = best_bound
+        self.nodes = nodes
+        return self.event(kind)
+
+    @property
+    def gap(self):
+        if self.incumbent is None or self.best_bound is None:
+            return None
+        return abs(self.best_bound - self.incumbent) / max(abs(self.incumbent), 1e-9)
+
+    def event(self, kind):
+        gap = self.gap
+        return {
+            "solve": self.name,
+            "event": kind,
+            "incumbent": self.incumbent,
+            "best_bound": self.best_bound,
+            "gap": round(gap, 6) if gap is not None else None,
+            "nodes": self.nodes,
+            "elapsed": round(time.time() - self.started, 2),
+        }
+
+
+# === Solve Statistics ===
+SIZE_RE = re.compile(r'^Problem \S+ has (\d+) rows, (\d+) columns and (\d+) elements')
+RESULT_RE = re.compile(r'^Result - (.*?)\s*$')
+SUMMARY_RE = re.compile(r'^(Objective value|Upper bound|Lower bound|Enumerated nodes|Total iterations|'
+                        r'Time \(CPU seconds\)|Time \(Wallclock seconds\)):\s+(\S+)')
+SUMMARY_FIELDS = {
+    'Objective value': 'objective',
+    'Upper bound': 'best_bound',      # maximisation
+    'Lower bound': 'best_bound',      # minimisation
+    'Enumerated nodes': 'nodes',
+    'Total iterations': 'iterations',
+    'Time (CPU seconds)': 'cpu_seconds',
+    'Time (Wallclock seconds)': 'wall_seconds',
+}
+# CBC's "Result - ..." text -> stop reason, first match wins
+STOP_REASONS = [
+    ('within gap tolerance', 'gap'),
+    ('optimal', 'optimal'),
+    ('time limit', 'time_limit'),
+    ('ctrl-c', 'cancelled'),
+    ('infeasible', 'infeasible'),
+    ('unbounded', 'unbounded'),
+]
+
+
+class SolveStats:
+    """What the solver reported about one solve (for CBC: parsed from its full log once it exits)."""
+
+    def __init__(self):
+        self.rows = None
+        self.columns = None
+        self.elements = None
+        self.result = None          # the solver's own status text (CBC: "Result - ...")
+        self.stop_reason = None     # optimal | gap | stall | time_limit | cancelled | infeasible | unbounded | other
+        self.objective = None
+        self.best_bound = None
+        self.nodes = None
+        self.iterations = None
+        self.cpu_seconds = None
+        self.wall_seconds = None
+
+    @classmethod
+    def from_log(cls, lines):
+        stats = cls()
+        for line in lines:
+            m = SUMMARY_RE.match(line)
+            if m:
+                value = float(m.group(2))
+                field = SUMMARY_FIELDS[m.group(1)]
+                setattr(stats, field, int(value) if field in ('nodes', 'iterations') else value)
+                continue
+            m = RESULT_RE.match(line)
+            if m:
+                stats.result = m.group(1)
+                text = stats.result.lower()
+                stats.stop_reason = next((reason for key, reason in STOP_REASONS if key in text), 'other')
+                continue
+            m = SIZE_RE.match(line)
+            if m:
+                stats.rows, stats.columns, stats.elements = (int(v) for v in m.groups())
+            elif stats.stop_reason is None and 'infeasible' in line.lower() and line.startswith(('Problem', 'Pre-processing')):
+                # Presolve can prove infeasibility without reaching a Result line
+                stats.stop_reason = 'infeasible'
+        if stats.stop_reason == 'optimal' and stats.best_bound is None:
+            stats.best_bound = stats.objective   # proven optimal: CBC prints no separate bound
+        return stats
+
+    def unscale(self, scale):
+        """Divide the objective values by the objective_scale the solver saw."""
+        if scale != 1.0:
+            self.objective = self.objective / scale if self.objective is not None else None
+            self.best_bound = self.best_bound / scale if self.best_bound is not None else None
+        return self
+
+    @property
+    def gap(self):
+        if self.objective is None or self.best_bound is None:
+            return None
+        return abs(self.best_bound - self.objective) / max(abs(self.objective), 1e-9)
+
+    @property
+    def hit_time_limit(self):
+        return self.stop_reason == 'time_limit'
+
+    def to_dict(self):
+        gap = self.gap
+        return {
+            "rows": self.rows,
+            "columns": self.columns,
+            "elements": self.elements,
+            "result": self.result,
+            "stop_reason": self.stop_reason,
+            "objective": self.objective,
+            "best_bound": self.best_bound,
+            "gap": round(gap, 6) if gap is not None else None,
+            "nodes": self.nodes,
+            "iterations": self.iterations,
+            "cpu_seconds": self.cpu_seconds,
+            "wall_seconds": self.wall_seconds,
+        }
+
+
+def objective_scale(lp):
+    """Factor the problem's objective was scaled by before solving (1.0 when unscaled)."""
+    return getattr(lp, 'objective_scale', 1.0)
+
+
+# === Response Stats ===
+
+def solver_stats(endpoint, prob, solver, build_seconds, solve_seconds, time_limit=None, warm_start=None,
+                 formulation=None, presolve=None):
+    """
+    The solver_stats block of an optimize response (one solve), recorded to
+    SOLVER_STATS_PATH as well. warm_start is the summary from
+    warm_start.apply_warm_start, when the request had one; formulation the
+    one from aggregation.solve_formulation; presolve the reduction the
+    presolve stage achieved.
+    """
+    stats = solver.stats or SolveStats()
+    gap = stats.gap
+    block = {
+        "endpoint": endpoint,
+        "model": prob.name,
+        "backend": solver.backend,
+        "build_seconds": round(build_seconds, 3),
+        "solve_seconds": round(solve_seconds, 3),
+        "variables": prob.numVariables(),
+        "constraints": prob.numConstraints(),
+        "nodes": stats.nodes,
+        "iterations": stats.iterations,
+        "objective": stats.objective,
+        "best_bound": stats.best_bound,
+        "gap": round(gap, 6) if gap is not None else None,
+        "stop_reason": stats.stop_reason,
+        "hit_time_limit": stats.stop_reason == 'time_limit',
+        "hit_gap_limit": stats.stop_reason == 'gap',
+        "hit_stall_limit": stats.stop_reason == 'stall',
+        "time_limit": time_limit,
+        "gap_rel": solver.optionsDict.get("gapRel"),
+        "gap_abs": solver.optionsDict.get("gapAbs"),
+        "stall_seconds": solver.stallSeconds,
+        "threads": solver.threads_used,
+        "thread_wait_seconds": round(solver.thread_wait_seconds, 3),
+        "cancelled": solver.cancelled,
+    }
+    if warm_start is not None:
+        block["warm_start"] = warm_start
+    if getattr(solver, "benchmark", None) is not None:
+        block["benchmark"] = solver.benchmark
+    if formulation is not None:
+        block["formulation"] = formulation
+    if presolve is not None:
+        block["presolve"] = presolve
+    return record_solver_stats(block)
+
+
+def rejected_stats(endpoint, model, build_seconds):
+    """solver_stats for a model the preflight screen rejected (no solve was run)."""
+    return record_solver_stats({
+        "endpoint": endpoint,
+        "model": model.name,
+        "build_seconds": round(build_seconds, 3),
+        "solve_seconds": 0.0,
+        "variables": model.n_vars,
+        "constraints": model.n_rows,
+        "stop_reason": "preflight",
+    })
+
+
+def record_solver_stats(stats):
+    if SOLVER_STATS_PATH:
+        try:
+            with open(SOLVER_STATS_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"recorded_at": time.time(), **stats}) + "\n")
+        except OSError:
+            traceback.print_exc()
+    return stats
+
+
+# === CBC Command ===
+
+def _log_channel():
+    """
+    (read_fd, write_fd) for CBC's output. A pseudo-terminal keeps CBC's stdout
+    line-buffered so progress arrives as it happens; a plain pipe (Windows)
+    only delivers it in 4 KB blocks.
+    """
+    try:
+        import pty
+        return pty.openpty()
+    except (ImportError, OSError):
+        return os.pipe()
+
+
+class MonitoredCBC(PULP_CBC_CMD):
+    """
+    PULP_CBC_CMD that reads CBC's log while it runs instead of letting it go
+    straight to stdout: lines are still echoed when msg=True, and progress
+    events go to the installed solve_monitor.
+    A cancelled solve is stopped like ctrl-c, so CBC still hands back its
+    incumbent; `cancelled` tells the caller it happened. stallSeconds stops
+    the same way once the incumbent has not improved for that long.
+    Every solve runs in its own workspace under SOLVER_TMP_DIR, removed
+    afterwards (kept, with cbc.log, when keepFiles=True), and leaves what CBC
+    reported in `stats`. CBC's thread count is leased from the host-wide
+    budget in solver_threads while it runs.
+    """
+    backend = 'cbc'
+    cancelled = False
+    stalled = False
+    stats = None
+    objective_scale = 1.0
+
+    def __init__(self, *args, stallSeconds=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stallSeconds = stallSeconds
+        # `threads` is an upper bound; the count actually used comes from the host-wide budget
+        self.max_threads = self.optionsDict.get("threads")
+        self.threads_used = None
+        self.thread_wait_seconds = 0.0
+
+    def solve_CBC(self, lp, use_mps=True):
+        if not use_mps:
+            return super().solve_CBC(lp, use_mps)
+        if not self.executable(self.path):
+            raise PulpSolverError(f"Pulp: cannot execute {self.path} cwd: {os.getcwd()}")
+
+        workspace = tempfile.mkdtemp(prefix="cbc-", dir=SOLVER_TMP_DIR)
+        try:
+            return self.solve_in(workspace, lp)
+        finally:
+            if self.keepFiles:
+                print(f"CBC workspace kept: {workspace}")
+            else:
+                shutil.rmtree(workspace, ignore_errors=True)
+
+    def solve_in(self, workspace, lp):
+        tmpMps, tmpSol, tmpMst = (os.path.join(workspace, f"model.{ext}") for ext in ("mps", "sol", "mst"))
+        vs, variablesNames, constraintsNames, _ = lp.writeMPS(tmpMps, rename=1)
+
+        self.objective_scale = objective_scale(lp)
+        progress = SolveProgress(lp.name, lp.sense, self.objective_scale)
+        self.cancelled = self.stalled = False
+        with solver_threads(self.max_threads) as (threads, waited):
+            self.threads_used, self.thread_wait_seconds = threads, waited
+            # -threads 1 still switches CBC to its threaded code path, so one thread means no option
+            self.optionsDict["threads"] = threads if threads > 1 else None
+            args = [self.path, tmpMps] + self.command_options(lp, vs, variablesNames, constraintsNames, tmpMst)
+            args += ["-printingOptions", "all", "-solution", tmpSol]
+            return_code, log_lines = self.run_cbc(args, progress, solve_monitor.get())
+        self.stats = SolveStats.from_log(log_lines).unscale(self.objective_scale)
+        if self.stalled and not self.cancelled:
+            self.stats.stop_reason = 'stall'   # CBC itself only saw a ctrl-c
+        if self.keepFiles:
+            with open(os.path.join(workspace, "cbc.log"), "w", encoding="utf-8") as f:
+                f.writelines(line + "\n" for line in log_lines)
+        if (self.cancelled or self.stalled) and (return_code != 0 or not os.path.exists(tmpSol)):
+            # Killed before it could write a solution: report "no incumbent"
+            lp.assignStatus(LpStatusNotSolved, LpSolutionNoSolutionFound)
+            return LpStatusNotSolved
+        if return_code != 0 or not os.path.exists(tmpSol):
+            raise PulpSolverError("Pulp: Error while executing " + self.path)
+
+        status, values, reducedCosts, shadowPrices, slacks, sol_status = self.readsol_MPS(
+            tmpSol, lp, vs, variablesNames, constraintsNames
+        )
+        lp.assignVarsVals(values)
+        lp.assignVarsDj(reducedCosts)
+        lp.assignConsPi(shadowPrices)
+        lp.assignConsSlack(slacks, activity=True)
+        lp.assignStatus(status, sol_status)
+        return status
+
+    def command_options(self, lp, vs, variablesNames, constraintsNames, tmpMst):
+        """CBC arguments between the model file and -printingOptions (same as PuLP builds)."""
+        args = []
+        if lp.sense == LpMaximize:
+            args.append("-max")
+        if self.optionsDict.get("warmStart", False):
+            self.writesol(tmpMst, lp, vs, variablesNames, constraintsNames)
+            args += ["-mips", tmpMst]
+        if self.timeLimit is not None:
+            args += ["-sec", str(self.timeLimit)]
+        for option in self.options + self.getOptions():
+            args += ("-" + option).split()
+        args.append("-branch" if self.mip else "-initialSolve")
+        return args
+
+    def getOptions(self):
+        # gapAbs is in the model's objective units; CBC works on the scaled objective
+        return [f"allow {self.optionsDict['gapAbs'] * self.objective_scale}" if option.startswith("allow ")
+                else option for option in super().getOptions()]
+
+    def writesol(self, filename, lp, vs, variablesNames, constraintsNames):
+        """
+        The -mips start file. Unlike PuLP's, variables without an initial value
+        are left out (not written as 0), so CBC completes a partial start.
+        """
+        values = {v.name: v.value() for v in vs}
+        with open(filename, "w") as f:
+            f.write("Stopped on time - objective value 0\n")
+            for i, (name, cbc_name) in enumerate(variablesNames.items()):
+                if values[name] is not None:
+                    f.write("{:>7} {} {:>15} {:>23}\n".format(i, cbc_name, values[name], 0))
+        return True
+
+    def run_cbc(self, args, progress, monitor):
+        """Run CBC to completion; returns (exit code, log lines)."""
+        read_fd, write_fd = _log_channel()
+        try:
+            cbc = subprocess.Popen(args, stdout=write_fd, stderr=write_fd, stdin=subprocess.DEVNULL)
+        finally:
+            os.close(write_fd)
+        cancellable = monitor is not None and hasattr(monitor, 'should_cancel')
+        if cancellable or self.stallSeconds:
+            threading.Thread(target=self.watch, args=(cbc, monitor if cancellable else None, progress),
+                             daemon=True).start()
+        log_lines = []
+        with os.fdopen(read_fd, "r", errors="replace") as output:
+            try:
+                for line in output:
+                    line = line.rstrip("\r\n")
+                    log_lines.append(line)
+                    if self.msg:
+                        sys.stdout.write(line + "\n")
+                    event = progress.feed(line)
+                    if event is not None and monitor is not None:
+                        _notify(monitor, event)
+            except OSError:
+                pass   # EIO from the pseudo-terminal once CBC has exited
+        return cbc.wait(), log_lines
+
+    def watch(self, cbc, monitor, progress):
+        """
+        Interrupt CBC once the monitor asks to cancel, or once an incumbent
+        exists and has not improved for stallSeconds. CBC ignores SIGINT until
+        branching starts, so it is repeated every poll; after the grace period
+        the process is killed.
+        """
+        stop_at = None
+        while cbc.poll() is None:
+            now = time.time()
+            if stop_at is None:
+                if monitor is not None and _should_cancel(monitor):
+                    self.cancelled = True
+                    stop_at = now
+                elif (self.stallSeconds and progress.improved_at is not None
+                      and now - progress.improved_at >= self.stallSeconds):
+                    self.stalled = True
+                    stop_at = now
+            if stop_at is not None:
+                if now - stop_at > SOLVER_CANCEL_GRACE_SECONDS:
+                    cbc.kill()
+                    return
+                _interrupt(cbc)
+            time.sleep(SOLVER_CANCEL_POLL_SECONDS)
+
+
+# === Backends ===
+
+def make_solver(backend=None, benchmark=False, **kwargs):
+    """
+    The solver for one request: `backend` (cbc | highs, default SOLVER_BACKEND)
+    built with MonitoredCBC's keyword arguments (timeLimit, gapRel, gapAbs,
+    stallSeconds, ...). With benchmark=True every other available backend
+    solves the same model first (see BenchmarkSolver).
+    """
+    primary = _backend_solver(backend or SOLVER_BACKEND, kwargs)
+    if not benchmark:
+        return primary
+    others = [_backend_solver(name, kwargs) for name in available_backends() if name != primary.backend]
+    return BenchmarkSolver(primary, others)
+
+
+def available_backends():
+    from solver_highs import highs_available
+    return [name for name in SOLVER_BACKENDS if name != 'highs' or highs_available()]
+
+
+def _backend_solver(name, kwargs):
+    if name == 'highs':
+        from solver_highs import MonitoredHiGHS, highs_available
+        if highs_available():
+            return MonitoredHiGHS(**kwargs)
+        print("HiGHS backend requested but highspy is not installed; solving with CBC")
+    return MonitoredCBC(**kwargs)
+
+
+class BenchmarkSolver:
+    """
+    Solves one model with each of `others`, then with `primary`, whose
+    solution is the one left on the problem. Everything else (stats,
+    cancelled, ...) is read from `primary`, so callers use it like a single
+    solver; `benchmark` lists backend, status, objective and time per run.
+    """
+
+    def __init__(self, primary, others):
+        self.primary = primary
+        self.others = others
+        self.benchmark = None
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+
+    def actualSolve(self, lp, **kwargs):
+        self.benchmark = []
+        status = None
+        # Initial values (warm start) for every run; a backend without a solution must not inherit the previous one's
+        start = [(v, v.varValue) for v in lp.variables()]
+        for solver in self.others + [self.primary]:
+            if solver is not self.primary and cancel_requested():
+                continue
+            for v, value in start:
+                v.varValue = value
+            t0 = time.perf_counter()
+            status = solver.actualSolve(lp, **kwargs)
+            stats = solver.stats or SolveStats()
+            gap = stats.gap
+            self.benchmark.append({
+                "backend": solver.backend,
+                "status": LpStatus[status],
+                "stop_reason": stats.stop_reason,
+                "objective": stats.objective,
+                "best_bound": stats.best_bound,
+                "gap": round(gap, 6) if gap is not None else None,
+                "nodes": stats.nodes,
+                "seconds": round(time.perf_counter() - t0, 3),
+            })
+        return status
+
+
+def cancel_requested():
+    """True when the installed monitor asks the current request to stop."""
+    monitor = solve_monitor.get()
+    return monitor is not None and hasattr(monitor, 'should_cancel') and _should_cancel(monitor)
+
+
+def _interrupt(cbc):
+    try:
+        cbc.send_signal(signal.SIGINT)
+    except (ValueError, OSError):
+        cbc.terminate()   # no SIGINT for child processes on Windows
+
+
+def _should_cancel(monitor):
+    try:
+        return bool(monitor.should_cancel())
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+def _notify(monitor, event):
+    # A broken monitor must never take the solve down with it
+    try:
+        monitor.on_progress(event)
+    except Exception:
+        traceback.print_exc()
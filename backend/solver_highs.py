@@ -0,0 +1,216 @@
+import math
+import time
+
+import numpy as np
+from pulp import (
+    LpSolver, LpMaximize, LpConstraintLE, LpConstraintGE, LpContinuous,
+    LpStatusOptimal, LpStatusInfeasible, LpStatusUnbounded, LpStatusNotSolved,
+    LpSolutionOptimal, LpSolutionIntegerFeasible, LpSolutionInfeasible,
+    LpSolutionUnbounded, LpSolutionNoSolutionFound,
+)
+
+from solver import (
+    SolveProgress, SolveStats, solve_monitor, objective_scale, SOLVER_CANCEL_POLL_SECONDS, NO_SOLUTION,
+    _should_cancel, _notify,
+)
+from solver_threads import solver_threads
+
+# highspy is optional: without it every request falls back to CBC
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+def highs_available():
+    return highspy is not None
+
+
+def _finite(value):
+    return value if value is not None and math.isfinite(value) and abs(value) < NO_SOLUTION else None
+
+
+class MonitoredHiGHS(LpSolver):
+    """
+    In-process HiGHS (highspy) with the same surface as MonitoredCBC:
+    progress events to the installed solve_monitor, cancel / stallSeconds
+    stops that keep the incumbent, gapRel / gapAbs targets, warmStart and
+    `stats`.
+    The model is passed to HiGHS as arrays, no files are written.
+    HiGHS's branch-and-bound runs on one thread, so one thread is leased
+    from the host-wide budget.
+    """
+    backend = 'highs'
+    cancelled = False
+    stalled = False
+    stats = None
+
+    def __init__(self, mip=True, msg=True, timeLimit=None, stallSeconds=None, **kwargs):
+        super().__init__(mip=mip, msg=msg, timeLimit=timeLimit, **kwargs)
+        self.stallSeconds = stallSeconds
+        self.threads_used = None
+        self.thread_wait_seconds = 0.0
+
+    def available(self):
+        return highs_available()
+
+    def actualSolve(self, lp, **kwargs):
+        scale = objective_scale(lp)
+        h = highspy.Highs()
+        h.setOptionValue("output_flag", bool(self.msg))
+        if self.timeLimit is not None:
+            h.setOptionValue("time_limit", float(self.timeLimit))
+        # CBC's defaults: run to a proven optimum unless a gap target is given
+        h.setOptionValue("mip_rel_gap", float(self.optionsDict.get("gapRel") or 0.0))
+        if self.optionsDict.get("gapAbs"):
+            h.setOptionValue("mip_abs_gap", float(self.optionsDict["gapAbs"]) * scale)
+        variables, integer = self.pass_model(h, lp)
+        if self.optionsDict.get("warmStart"):
+            self.set_start(h, variables)
+
+        progress = SolveProgress(lp.name, lp.sense, scale)
+        self.cancelled = self.stalled = False
+        with solver_threads(1) as (threads, waited):
+            self.threads_used, self.thread_wait_seconds = threads, waited
+            h.setOptionValue("threads", threads)
+            self.watch(h, progress, solve_monitor.get())
+            start_cpu = time.process_time()
+            h.run()
+            cpu_seconds = time.process_time() - start_cpu
+
+        status = h.getModelStatus()
+        info = h.getInfo()
+        has_solution = info.primal_solution_status == 2   # kSolutionStatusFeasible
+        self.stats = self.read_stats(h, status, info, has_solution, cpu_seconds).unscale(scale)
+
+        if has_solution:
+            values = h.getSolution().col_value
+            lp.assignVarsVals({
+                v.name: float(round(value)) if is_int else value
+                for v, value, is_int in zip(variables, values, integer)
+            })
+        lp_status, sol_status = self.lp_status(status, has_solution)
+        lp.assignStatus(lp_status, sol_status)
+        return lp_status
+
+    def pass_model(self, h, lp):
+        """Load lp into h column-wise; returns (variables, is-integer flags) in column order."""
+        inf = highspy.kHighsInf
+        variables = lp.variables()
+        col = {v.name: j for j, v in enumerate(variables)}
+        n = len(variables)
+        lower = [v.lowBound if v.lowBound is not None else -inf for v in variables]
+        upper = [v.upBound if v.upBound is not None else inf for v in variables]
+        h.addVars(n, lower, upper)
+        h.changeObjectiveSense(highspy.ObjSense.kMaximize if lp.sense == LpMaximize else highspy.ObjSense.kMinimize)
+
+        cost = [0.0] * n
+        for v, coef in lp.objective.items():
+            cost[col[v.name]] = coef
+        h.changeColsCost(n, list(range(n)), cost)
+        h.changeObjectiveOffset(lp.objective.constant)
+
+        integer = [self.mip and v.cat != LpContinuous for v in variables]
+        int_cols = [j for j, flag in enumerate(integer) if flag]
+        if int_cols:
+            h.changeColsIntegrality(len(int_cols), int_cols, [highspy.HighsVarType.kInteger] * len(int_cols))
+
+        row_lower, row_upper, starts, index, value = [], [], [], [], []
+        for constraint in lp.constraints.values():
+            rhs = -constraint.constant
+            row_lower.append(-inf if constraint.sense == LpConstraintLE else rhs)
+            row_upper.append(inf if constraint.sense == LpConstraintGE else rhs)
+            starts.append(len(index))
+            for v, coef in constraint.items():
+                index.append(col[v.name])
+                value.append(coef)
+        if row_lower:
+            h.addRows(len(row_lower), row_lower, row_upper, len(index), starts, index, value)
+        return variables, integer
+
+    @staticmethod
+    def set_start(h, variables):
+        """Initial values (setInitialValue) as HiGHS's starting solution; it completes partial ones."""
+        start = [(j, v.varValue) for j, v in enumerate(variables) if v.varValue is not None]
+        if start:
+            index, value = zip(*start)
+            h.setSolution(len(start), np.array(index, dtype=np.int32), np.array(value, dtype=float))
+
+    def watch(self, h, progress, monitor):
+        """
+        Report HiGHS's callbacks as progress events, and interrupt the solve
+        once the monitor asks to cancel or the incumbent has stalled.
+        """
+        cb = highspy.cb.HighsCallbackType
+        cancellable = monitor is not None and hasattr(monitor, 'should_cancel')
+        last_poll = [0.0]
+
+        def callback(kind, message, data_out, data_in, user_data):
+            improving = kind == cb.kCallbackMipImprovingSolution
+            now = time.time()
+            if not improving:
+                if now - last_poll[0] < SOLVER_CANCEL_POLL_SECONDS:
+                    return
+                last_poll[0] = now
+            event = progress.update('incumbent' if improving else 'nodes',
+                                    _finite(data_out.mip_primal_bound), _finite(data_out.mip_dual_bound),
+                                    int(data_out.mip_node_count))
+            if monitor is not None:
+                _notify(monitor, event)
+            if improving:
+                return
+            if cancellable and (self.cancelled or _should_cancel(monitor)):
+                self.cancelled = True
+            elif (self.stallSeconds and progress.improved_at is not None
+                  and now - progress.improved_at >= self.stallSeconds):
+                self.stalled = True
+            if self.cancelled or self.stalled:
+                data_in.user_interrupt = True
+
+        h.setCallback(callback, None)
+        h.startCallback(cb.kCallbackMipImprovingSolution)
+        h.startCallback(cb.kCallbackMipInterrupt)
+
+    def read_stats(self, h, status, info, has_solution, cpu_seconds):
+        ms = highspy.HighsModelStatus
+        stats = SolveStats()
+        stats.rows, stats.columns = h.getNumRow(), h.getNumCol()
+        stats.elements = h.getNumNz()
+        stats.result = h.modelStatusToString(status)
+        stats.objective = info.objective_function_value if has_solution else None
+        stats.best_bound = _finite(info.mip_dual_bound) if self.mip else None
+        stats.nodes = info.mip_node_count
+        stats.iterations = info.simplex_iteration_count
+        stats.cpu_seconds = round(cpu_seconds, 2)
+        stats.wall_seconds = round(h.getRunTime(), 2)
+        if status == ms.kOptimal:
+            if stats.best_bound is None:
+                stats.best_bound = stats.objective
+            targets = self.optionsDict.get("gapRel") or self.optionsDict.get("gapAbs")
+            stats.stop_reason = 'gap' if targets and stats.gap else 'optimal'
+        elif status == ms.kTimeLimit:
+            stats.stop_reason = 'time_limit'
+        elif status == ms.kInterrupt:
+            stats.stop_reason = 'stall' if self.stalled and not self.cancelled else 'cancelled'
+        elif status in (ms.kInfeasible, ms.kUnboundedOrInfeasible):
+            stats.stop_reason = 'infeasible'
+        elif status == ms.kUnbounded:
+            stats.stop_reason = 'unbounded'
+        else:
+            stats.stop_reason = 'other'
+        return stats
+
+    @staticmethod
+    def lp_status(status, has_solution):
+        """PuLP (status, solution status), as PuLP reports the same outcome from CBC."""
+        ms = highspy.HighsModelStatus
+        if status == ms.kOptimal:
+            return LpStatusOptimal, LpSolutionOptimal
+        if status in (ms.kInfeasible, ms.kUnboundedOrInfeasible):
+            return LpStatusInfeasible, LpSolutionInfeasible
+        if status == ms.kUnbounded:
+            return LpStatusUnbounded, LpSolutionUnbounded
+        if has_solution:
+            # Time limit / interrupt with an incumbent
+            return LpStatusOptimal, LpSolutionIntegerFeasible
+        return LpStatusNotSolved, LpSolutionNoSolutionFound
@@ -0,0 +1,140 @@
+import os
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+
+# === Thread Budget Settings ===
+# Every CBC run on the host (gunicorn workers, job workers, bonus channel
+# workers) leases its threads from one table, so the sum never exceeds
+# SOLVER_THREADS_TOTAL however many processes are solving.
+SOLVER_THREADS_TOTAL = max(1, int(os.environ.get("SOLVER_THREADS_TOTAL") or os.cpu_count() or 1))
+# Most threads one solve may take (a lone solve leaves room for the next one)
+SOLVER_THREADS_PER_SOLVE = max(1, int(os.environ.get("SOLVER_THREADS_PER_SOLVE") or max(1, SOLVER_THREADS_TOTAL // 2)))
+SOLVER_THREADS_DB_PATH = os.environ.get(
+    "SOLVER_THREADS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver_threads.db")
+)
+# Leases older than this are treated as leaked (longer than any solve's time limit)
+SOLVER_THREADS_STALE_SECONDS = int(os.environ.get("SOLVER_THREADS_STALE_SECONDS", 3600))
+
+_schema_ready = False
+
+
+# === Lease Table ===
+
+def _connect():
+    global _schema_ready
+    conn = sqlite3.connect(SOLVER_THREADS_DB_PATH, timeout=30, isolation_level=None)
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS solver_threads (
+                id         TEXT PRIMARY KEY,
+                pid        INTEGER NOT NULL,
+                threads    INTEGER NOT NULL,   -- 0 while waiting for a lease
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        _schema_ready = True
+    return conn
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _prune(conn, now):
+    # Leases of processes that died mid-solve, and leases nobody released
+    conn.execute("DELETE FROM solver_threads WHERE created_at < ?", (now - SOLVER_THREADS_STALE_SECONDS,))
+    for (lease_id, pid) in conn.execute("SELECT id, pid FROM solver_threads").fetchall():
+        if not _pid_alive(pid):
+            conn.execute("DELETE FROM solver_threads WHERE id = ?", (lease_id,))
+
+
+# === Leases ===
+
+def acquire_threads(limit=None):
+    """
+    Block until at least one solver thread is free on the host, then take a
+    fair share of what is free: free // (solves waiting + 1), at most `limit`
+    (default SOLVER_THREADS_PER_SOLVE). Returns (lease_id, threads, seconds waited).
+    """
+    limit = max(1, min(limit or SOLVER_THREADS_PER_SOLVE, SOLVER_THREADS_TOTAL))
+    lease_id = uuid.uuid4().hex
+    start_ts = time.time()
+
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO solver_threads (id, pid, threads, created_at) VALUES (?, ?, 0, ?)",
+            (lease_id, os.getpid(), start_ts)
+        )
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _prune(conn, now)
+                used, waiting = conn.execute(
+                    "SELECT COALESCE(SUM(threads), 0), COALESCE(SUM(threads = 0 AND id != ?), 0) FROM solver_threads",
+                    (lease_id,)
+                ).fetchone()
+                free = SOLVER_THREADS_TOTAL - used
+                if free >= 1:
+                    threads = max(1, min(limit, free // (waiting + 1)))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO solver_threads (id, pid, threads, created_at) VALUES (?, ?, ?, ?)",
+                        (lease_id, os.getpid(), threads, now)
+                    )
+                    conn.execute("COMMIT")
+                    return lease_id, threads, now - start_ts
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            time.sleep(0.25)
+    except BaseException:
+        conn.execute("DELETE FROM solver_threads WHERE id = ?", (lease_id,))
+        raise
+    finally:
+        conn.close()
+
+
+def release_threads(lease_id):
+    conn = _connect()
+    conn.execute("DELETE FROM solver_threads WHERE id = ?", (lease_id,))
+    conn.close()
+
+
+@contextmanager
+def solver_threads(limit=None):
+    """with solver_threads() as (threads, waited): run one solve on `threads` threads."""
+    lease_id, threads, waited = acquire_threads(limit)
+    try:
+        yield threads, waited
+    finally:
+        release_threads(lease_id)
+
+
+def thread_usage():
+    """Current leases on this host (for /db-pool-stats style monitoring)."""
+    conn = _connect()
+    used, running, waiting = conn.execute(
+        "SELECT COALESCE(SUM(threads), 0), COALESCE(SUM(threads > 0), 0), COALESCE(SUM(threads = 0), 0) "
+        "FROM solver_threads"
+    ).fetchone()
+    conn.close()
+    return {
+        "threads_total": SOLVER_THREADS_TOTAL,
+        "threads_per_solve": SOLVER_THREADS_PER_SOLVE,
+        "threads_in_use": used,
+        "solves_running": running,
+        "solves_waiting": waiting,
+    }
@@ -1 +1,38 @@
- 
+import json
+import hashlib
+
+import numpy as np
+
+
+def _normalize(value):
+    """Recursively coerce a JSON-like value so equal inputs serialise identically (10 == 10.0)."""
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (bool, np.bool_)) or value is None:
+        return bool(value) if value is not None else None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        f = float(value)
+        return f if np.isfinite(f) else None
+    return value
+
+
+def json_default(value):
+    """json.dumps fallback for NumPy scalars and other stray objects in response bodies."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def canonical_json(value):
+    return json.dumps(_normalize(value), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def digest(*parts):
+    """sha256 hex digest over canonical JSON of the given parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(canonical_json(part).encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
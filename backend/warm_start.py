@@ -0,0 +1,185 @@
+import json
+import traceback
+
+# === Warm Start ===
+# A request's `warm_start` names an earlier allocation:
+#   [ {Id, Commercial, Spots, ...}, ... ]   a previous df_result / by_program table
+#   { ...previous response... }             its df_result (or tables.by_program) is used
+#   {"job_id": "..."} or "<job id>"         the result of a finished optimization job
+#   {"plan_id": 12} or 12                   a saved plan whose session_data holds such a table
+# Its spots are set as the initial value of the variable with the same
+# program Id + Commercial; every other variable starts at 0 (results only list
+# rows with spots). The solver gets this as its starting incumbent.
+# After a share change the old plan usually breaks a few channel / slot rows:
+# the variables of those rows are left unset, so the solver completes the
+# rest of the old plan instead of discarding it.
+
+KEY_COLUMNS = ('Id', 'Commercial')
+
+
+def result_rows(body):
+    """The per-program rows of an optimize response (None when it has none)."""
+    if not isinstance(body, dict):
+        return None
+    rows = body.get('df_result')
+    if rows is None:
+        rows = (body.get('tables') or {}).get('by_program')
+    return rows if isinstance(rows, list) else None
+
+
+def _spot_rows(value):
+    # First list of records with Spots + key columns, anywhere in a saved session
+    if isinstance(value, list):
+        if value and all(isinstance(r, dict) and 'Spots' in r and all(k in r for k in KEY_COLUMNS) for r in value):
+            return value
+        items = value
+    elif isinstance(value, dict):
+        items = value.values()
+    else:
+        return None
+    for item in items:
+        rows = _spot_rows(item)
+        if rows is not None:
+            return rows
+    return None
+
+
+def _job_rows(job_id):
+    from jobs import get_job
+    job = get_job(str(job_id))
+    if job is None:
+        return None, f"job {job_id} not found"
+    if job["status"] not in ('done', 'cancelled'):
+        return None, f"job {job_id} is {job['status']}"
+    rows = result_rows(job.get("result"))
+    return rows, None if rows is not None else f"job {job_id} has no result rows"
+
+
+def _plan_rows(plan_id):
+    from database import db_connection
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT data FROM saved_plans WHERE id = %s", (plan_id,))
+        row = cursor.fetchone()
+    if not row:
+        return None, f"plan {plan_id} not found"
+    blob = row.get("data")
+    parsed = json.loads(blob) if isinstance(blob, str) else (blob or {})
+    rows = _spot_rows(parsed.get("session_data") or {})
+    return rows, None if rows is not None else f"plan {plan_id} has no saved allocation"
+
+
+def resolve_warm_start(value):
+    """
+    Resolve a request's warm_start into (source, rows, error); (None, None, None)
+    when none was given. Lookups that fail leave the solve cold, with the reason.
+    """
+    if value in (None, '', [], {}):
+        return None, None, None
+    if isinstance(value, list):
+        return 'df_result', value, None
+    if isinstance(value, dict) and not (value.get('job_id') or value.get('plan_id') is not None):
+        rows = result_rows(value)
+        return 'result', rows, None if rows is not None else "warm_start has no result rows"
+
+    if isinstance(value, dict):
+        source, ref = ('job', value['job_id']) if value.get('job_id') else ('plan', value['plan_id'])
+    elif isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        source, ref = 'plan', value
+    elif isinstance(value, str):
+        source, ref = 'job', value
+    else:
+        return 'unknown', None, "unsupported warm_start value"
+    try:
+        rows, error = _job_rows(ref) if source == 'job' else _plan_rows(int(ref))
+    except Exception as e:
+        traceback.print_exc()
+        rows, error = None, str(e)
+    return source, rows, error
+
+
+def start_key(program_id, commercial):
+    # JSON round trips turn ints into floats/strings; compare on one spelling
+    def norm(v):
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        return str(v)
+    return norm(program_id), norm(commercial)
+
+
+def start_spots(rows):
+    """{(Id, Commercial): spots} from previous result rows."""
+    spots = {}
+    for r in rows or []:
+        if not isinstance(r, dict) or any(k not in r for k in KEY_COLUMNS):
+            continue
+        try:
+            value = int(round(float(r.get('Spots') or 0)))
+        except (TypeError, ValueError):
+            continue
+        key = start_key(r['Id'], r['Commercial'])
+        spots[key] = spots.get(key, 0) + value
+    return spots
+
+
+def warm_start_spots(data):
+    """
+    (spots by (Id, Commercial), summary) for the request's warm_start; spots is
+    None when there is nothing to start from.
+    """
+    source, rows, error = resolve_warm_start(data.get('warm_start'))
+    if source is None:
+        return None, None
+    spots = start_spots(rows) if rows is not None else {}
+    summary = {"source": source, "rows": len(spots)}
+    if error:
+        summary["error"] = error
+    return (spots or None), summary
+
+
+def apply_warm_start(prob, df, variables, spots, summary, presolved=None):
+    """
+    Set each variable's initial value from `spots` (variables are in df row
+    order, or the columns of `presolved`), clipped to its bounds, then unset
+    the variables of the rows the start violates. Returns the summary with the
+    match / repair counts, or None when there is no start.
+    """
+    if summary is None:
+        return None
+    if not spots:
+        return dict(summary, matched=0, applied=False)
+    if 'Id' not in df.columns:
+        return dict(summary, matched=0, applied=False, error="df_full has no Id column")
+
+    commercials = df['Commercial'].tolist() if 'Commercial' in df.columns else [0] * len(df)
+    starts = [spots.get(start_key(program_id, commercial))
+              for program_id, commercial in zip(df['Id'].tolist(), commercials)]
+    matched = sum(value is not None for value in starts)
+    starts = [value or 0 for value in starts]
+    if presolved is not None:
+        starts = presolved.collapse(starts)
+    for var, value in zip(variables, starts):
+        if var.lowBound is not None:
+            value = max(value, var.lowBound)
+        if var.upBound is not None:
+            value = min(value, var.upBound)
+        var.setInitialValue(value)
+    violated, freed = repair_start(prob, variables)
+    return dict(summary, matched=matched, applied=matched > 0, violated_rows=violated, freed=freed)
+
+
+def repair_start(prob, variables, tol=1e-6):
+    """
+    Unset the start of every variable in a violated row, except rows over
+    most of the model (e.g. the total budget), which would free everything.
+    Returns (violated rows, variables left unset).
+    """
+    violated = [c for c in prob.constraints.values() if not c.valid(tol)]
+    free = set()
+    for constraint in violated:
+        if len(constraint) <= len(variables) / 2:
+            free.update(v.name for v in constraint.keys())
+    for var in variables:
+        if var.name in free:
+            var.varValue = None
+    return len(violated), len(free)